@@ -10,6 +10,7 @@ import logging
 import zarr
 from zarr.hierarchy import Group
 from zarr.core import Array
+from zarr.util import json_dumps
 from zarr.storage import (DirectoryStore,
                           TempStore,
                           NestedDirectoryStore)
@@ -22,6 +23,8 @@ from .utils import (ZarrDataIO,
                     ZarrSpecReader,
                     ZarrIODataChunkIteratorQueue)
 from .zarr_utils import BuilderZarrReferenceDataset, BuilderZarrTableDataset
+from .storage import (ConcurrentFSStore, ArrowFSStore, BatchedMetadataStore, DirectDirectoryStore,
+                      PreloadedMetadataStore, UringDirectoryStore)
 
 # HDMF imports
 from hdmf.backends.io import HDMFIO
@@ -99,11 +102,49 @@ class ZarrIO(HDMFIO):
              'default': None},
             {'name': 'storage_options', 'type': dict,
              'doc': 'Zarr storage options to read remote folders',
-             'default': None})
+             'default': None},
+            {'name': 'max_concurrent_reads', 'type': int,
+             'doc': 'Maximum number of chunk reads to issue concurrently when accessing a remote file. '
+                    'Only used if path is an fsspec URL, e.g., "s3://" or "https://". If None, then all chunks '
+                    'of a selection are requested at once for asynchronous filesystems (e.g., s3fs) as by '
+                    'fsspec, and up to 16 chunks at a time are read for synchronous filesystems and by pyarrow.',
+             'default': None},
+            {'name': 'remote_store', 'type': str,
+             'doc': 'The library used to read remote files, one of ("fsspec", "pyarrow"). "pyarrow" requires pyarrow '
+                    'to be installed and is only used to read "s3://" URLs in mode "r" or "r-". All other remote '
+                    'files are accessed via fsspec.',
+             'default': 'fsspec'},
+            {'name': 'direct_io', 'type': bool,
+             'doc': 'Write chunks with direct I/O (O_DIRECT), bypassing the page cache, using a '
+                    ':py:class:`~hdmf_zarr.storage.DirectDirectoryStore`. Only used if path is a local path. '
+                    'Chunks written by worker processes in parallel writes use buffered I/O.',
+             'default': False},
+            {'name': 'io_uring', 'type': bool,
+             'doc': 'Write the chunks of a selection with batched io_uring submissions using a '
+                    ':py:class:`~hdmf_zarr.storage.UringDirectoryStore`. Only used if path is a local path. '
+                    'Requires liburing to be installed and Linux, otherwise chunks are written as usual. '
+                    'Cannot be combined with direct_io.',
+             'default': False},
+            {'name': 'preload_metadata', 'type': bool,
+             'doc': 'Read all metadata of remote files without consolidated metadata at once in mode "r" using a '
+                    ':py:class:`~hdmf_zarr.storage.PreloadedMetadataStore`. This lists all keys of the file, '
+                    'including all chunks, such that it is only beneficial for files with few chunks compared to '
+                    'the number of groups and arrays. If the file cannot be listed, then the metadata is read '
+                    'as needed.',
+             'default': False})
     def __init__(self, **kwargs):
         self.logger = logging.getLogger('%s.%s' % (self.__class__.__module__, self.__class__.__qualname__))
-        path, manager, mode, synchronizer, object_codec_class, storage_options = popargs(
-            'path', 'manager', 'mode', 'synchronizer', 'object_codec_class', 'storage_options', kwargs)
+        path, manager, mode, synchronizer, object_codec_class, storage_options, max_concurrent_reads, remote_store = \
+            popargs('path', 'manager', 'mode', 'synchronizer', 'object_codec_class', 'storage_options',
+                    'max_concurrent_reads', 'remote_store', kwargs)
+        direct_io, io_uring, preload_metadata = popargs('direct_io', 'io_uring', 'preload_metadata', kwargs)
+        self.__remote_stores = dict()  # stores used to open remote files, reused for resolving references
+        self.__metadata_stores = dict()  # preloaded metadata of remote files without consolidated metadata
+        self.__file = None
+        if remote_store not in ('fsspec', 'pyarrow'):
+            raise ValueError("remote_store must be one of ('fsspec', 'pyarrow'), received '%s'" % remote_store)
+        if direct_io and io_uring:
+            raise ValueError("direct_io and io_uring cannot be used together")
         if manager is None:
             manager = BuildManager(TypeMap(NamespaceCatalog()))
         if isinstance(synchronizer, bool):
@@ -116,8 +157,12 @@ class ZarrIO(HDMFIO):
             self.__synchronizer = synchronizer
         self.__mode = mode
         self.__path = path
-        self.__file = None
         self.__storage_options = storage_options
+        self.__max_concurrent_reads = max_concurrent_reads
+        self.__remote_store = remote_store
+        self.__direct_io = direct_io
+        self.__io_uring = io_uring
+        self.__preload_metadata = preload_metadata
         self.__built = dict()
         self._written_builders = WriteStatusTracker()  # track which builders were written (or read) by this IO object
         self.__dci_queue = None  # Will be initialized on call to io.write
@@ -155,6 +200,31 @@ class ZarrIO(HDMFIO):
     def object_codec_class(self):
         return self.__codec_cls
 
+    @property
+    def max_concurrent_reads(self):
+        """Maximum number of chunk reads issued concurrently when accessing a remote file"""
+        return self.__max_concurrent_reads
+
+    @property
+    def remote_store(self):
+        """The library used to read remote files, either 'fsspec' or 'pyarrow'"""
+        return self.__remote_store
+
+    @property
+    def direct_io(self):
+        """Whether chunks of local files are written with direct I/O"""
+        return self.__direct_io
+
+    @property
+    def io_uring(self):
+        """Whether chunks of local files are written with io_uring"""
+        return self.__io_uring
+
+    @property
+    def preload_metadata(self):
+        """Whether the metadata of remote files without consolidated metadata is read at once"""
+        return self.__preload_metadata
+
     def open(self):
         """Open the Zarr file"""
         if self.__file is None:
@@ -167,7 +237,8 @@ class ZarrIO(HDMFIO):
                 # r- is only an internal mode in ZarrIO to force the use of regular open. For Zarr we need to
                 # use the regular mode r when r- is specified
                 mode_to_use = self.__mode if self.__mode != 'r-' else 'r'
-                self.__file = zarr.open(store=self.path,
+                store = self.__resolve_store(self.path, mode_to_use, self.__storage_options)
+                self.__file = zarr.open(store=store,
                                         mode=mode_to_use,
                                         synchronizer=self.__synchronizer,
                                         storage_options=self.__storage_options)
@@ -179,13 +250,24 @@ class ZarrIO(HDMFIO):
 
     def close(self):
         """Close the Zarr file"""
+        # close() is also called by __del__ of objects whose initialization failed before ZarrIO.__init__
+        # set these attributes, e.g., if NWBZarrIO fails to load the namespaces of the file
+        file = getattr(self, '_ZarrIO__file', None)
+        if file is not None and isinstance(file.store, UringDirectoryStore):
+            file.store.close()
         self.__file = None
+        self.__remote_stores = dict()
+        self.__metadata_stores = dict()
         return
 
     def is_remote(self):
         """Return True if the file is remote, False otherwise"""
         from zarr.storage import FSStore
-        if isinstance(self.file.store, FSStore):
+        store = self.file.store
+        # Files opened with consolidated metadata use a ConsolidatedMetadataStore wrapping the actual store
+        if isinstance(store, zarr.storage.ConsolidatedMetadataStore):
+            store = store.store
+        if isinstance(store, (FSStore, ArrowFSStore)):
             return True
         else:
             return False
@@ -253,10 +335,30 @@ class ZarrIO(HDMFIO):
             "type": str,
             "doc": (
                 "Context for multiprocessing. It can be None (default), 'fork' or 'spawn'. "
-                "Note that 'fork' is only available on UNIX systems (not Windows)."
+                "Note that 'fork' is only available on UNIX systems (not Windows). "
+                "If None, then 'fork' is used on Linux and the default context of the platform otherwise."
             ),
             "default": None,
         },
+        {
+            "name": "reuse_pool",
+            "type": bool,
+            "doc": (
+                "Keep the pool of worker processes alive after the write and reuse it for subsequent writes "
+                "with the same number_of_jobs, max_threads_per_process, and multiprocessing_context. "
+                "Use :py:func:`hdmf_zarr.utils.shutdown_process_pools` to shut down the pools before exiting."
+            ),
+            "default": False,
+        },
+        {
+            "name": "use_threads",
+            "type": bool,
+            "doc": (
+                "Write in parallel with threads instead of processes if the compressors of all datasets release "
+                "the GIL (e.g., Blosc). Iterators then need not be pickleable but must be thread-safe."
+            ),
+            "default": False,
+        },
         {
             "name": "consolidate_metadata",
             "type": bool,
@@ -268,14 +370,16 @@ class ZarrIO(HDMFIO):
     )
     def write(self, **kwargs):
         """Overwrite the write method to add support for caching the specification and parallelization."""
-        cache_spec, number_of_jobs, max_threads_per_process, multiprocessing_context = popargs(
-            "cache_spec", "number_of_jobs", "max_threads_per_process", "multiprocessing_context", kwargs
-        )
+        cache_spec, number_of_jobs, max_threads_per_process, multiprocessing_context, reuse_pool, use_threads = \
+            popargs("cache_spec", "number_of_jobs", "max_threads_per_process", "multiprocessing_context",
+                    "reuse_pool", "use_threads", kwargs)
 
         self.__dci_queue = ZarrIODataChunkIteratorQueue(
             number_of_jobs=number_of_jobs,
             max_threads_per_process=max_threads_per_process,
             multiprocessing_context=multiprocessing_context,
+            reuse_pool=reuse_pool,
+            use_threads=use_threads,
         )
 
         super(ZarrIO, self).write(**kwargs)
@@ -329,10 +433,30 @@ class ZarrIO(HDMFIO):
             "type": str,
             "doc": (
                 "Context for multiprocessing. It can be None (default), 'fork' or 'spawn'. "
-                "Note that 'fork' is only available on UNIX systems (not Windows)."
+                "Note that 'fork' is only available on UNIX systems (not Windows). "
+                "If None, then 'fork' is used on Linux and the default context of the platform otherwise."
             ),
             "default": None,
         },
+        {
+            "name": "reuse_pool",
+            "type": bool,
+            "doc": (
+                "Keep the pool of worker processes alive after the write and reuse it for subsequent writes "
+                "with the same number_of_jobs, max_threads_per_process, and multiprocessing_context. "
+                "Use :py:func:`hdmf_zarr.utils.shutdown_process_pools` to shut down the pools before exiting."
+            ),
+            "default": False,
+        },
+        {
+            "name": "use_threads",
+            "type": bool,
+            "doc": (
+                "Write in parallel with threads instead of processes if the compressors of all datasets release "
+                "the GIL (e.g., Blosc). Iterators then need not be pickleable but must be thread-safe."
+            ),
+            "default": False,
+        },
     )
     def export(self, **kwargs):
         """Export data read from a file from any backend to Zarr.
@@ -344,14 +468,16 @@ class ZarrIO(HDMFIO):
 
         src_io = getargs('src_io', kwargs)
         write_args, cache_spec = popargs('write_args', 'cache_spec', kwargs)
-        number_of_jobs, max_threads_per_process, multiprocessing_context = popargs(
-            "number_of_jobs", "max_threads_per_process", "multiprocessing_context", kwargs
+        number_of_jobs, max_threads_per_process, multiprocessing_context, reuse_pool, use_threads = popargs(
+            "number_of_jobs", "max_threads_per_process", "multiprocessing_context", "reuse_pool", "use_threads", kwargs
         )
 
         self.__dci_queue = ZarrIODataChunkIteratorQueue(
             number_of_jobs=number_of_jobs,
             max_threads_per_process=max_threads_per_process,
             multiprocessing_context=multiprocessing_context,
+            reuse_pool=reuse_pool,
+            use_threads=use_threads,
         )
 
         if not isinstance(src_io, ZarrIO) and write_args.get('link_data', True):
@@ -480,6 +606,42 @@ class ZarrIO(HDMFIO):
 
         return fpath
 
+    def __resolve_store(self, store, mode, storage_options=None):
+        """
+        Resolve the Zarr store to use for opening the given path.
+
+        Remote paths (i.e., fsspec URLs such as "s3://" or "https://") are opened with a
+        :py:class:`~hdmf_zarr.storage.ConcurrentFSStore` such that reads of multiple chunks
+        are issued concurrently. If remote_store is 'pyarrow', then "s3://" URLs are opened
+        for read with a :py:class:`~hdmf_zarr.storage.ArrowFSStore` instead. If direct_io or io_uring is True,
+        then local paths are opened with a :py:class:`~hdmf_zarr.storage.DirectDirectoryStore` or
+        :py:class:`~hdmf_zarr.storage.UringDirectoryStore`, respectively.
+        All other paths and stores are returned as is.
+
+        The remote stores are reused when the same file is opened again with the same mode, e.g., to
+        resolve references, such that values cached by the store in read mode are not read again.
+        """
+        if not (isinstance(store, str) and ("://" in store or "::" in store)):
+            if self.__direct_io and isinstance(store, str):
+                return DirectDirectoryStore(store)
+            if self.__io_uring and isinstance(store, str):
+                return UringDirectoryStore(store)
+            return store
+        store_key = (store.rstrip("/"), mode)
+        if store_key not in self.__remote_stores:
+            if self.__remote_store == 'pyarrow' and store.startswith('s3://') and mode == 'r':
+                self.__remote_stores[store_key] = ArrowFSStore.from_url(
+                    store,
+                    max_concurrent_reads=self.__max_concurrent_reads,
+                    **(storage_options or {}))
+            else:
+                self.__remote_stores[store_key] = ConcurrentFSStore(
+                    store,
+                    mode=mode,
+                    max_concurrent_reads=self.__max_concurrent_reads,
+                    **(storage_options or {}))
+        return self.__remote_stores[store_key]
+
     def __open_file_consolidated(self,
                                  store,
                                  mode,
@@ -487,21 +649,52 @@ class ZarrIO(HDMFIO):
                                  storage_options=None):
         """
         This method will check to see if the metadata has been consolidated.
-        If so, use open_consolidated.
+        If so, use open_consolidated. Otherwise, if preload_metadata is True, remote files opened in read mode
+        use a :py:class:`~hdmf_zarr.storage.PreloadedMetadataStore` to read all metadata at once, unless the
+        file cannot be listed (e.g., HTTP servers without directory listings).
         """
         # This check is just a safeguard for possible errors in the future. But this should never happen
         if mode == 'r-':
             raise ValueError('Mode r- not allowed for reading with consolidated metadata')
+        store = self.__resolve_store(store, mode, storage_options)
+        if id(store) in self.__metadata_stores:
+            return zarr.open(store=self.__metadata_stores[id(store)],
+                             chunk_store=store,
+                             mode=mode,
+                             synchronizer=synchronizer)
         try:
-            return zarr.open_consolidated(store=store,
+            file = zarr.open_consolidated(store=store,
                                           mode=mode,
                                           synchronizer=synchronizer,
                                           storage_options=storage_options)
         except KeyError:  # A KeyError is raised when the '/.zmetadata' does not exist
-            return zarr.open(store=store,
-                             mode=mode,
-                             synchronizer=synchronizer,
-                             storage_options=storage_options)
+            pass
+        else:
+            # The metadata of the arrays are read from the consolidated metadata rather than from the store,
+            # such that the store needs them separately to prefetch chunks
+            if isinstance(store, (ConcurrentFSStore, ArrowFSStore)):
+                store.set_metadata_store(file.store.meta_store)
+            return file
+        # For remote files without consolidated metadata, read all metadata at once rather than
+        # one request per group and array. The metadata are kept to resolve references without listing again.
+        if self.__preload_metadata and mode == 'r' and isinstance(store, (ConcurrentFSStore, ArrowFSStore)):
+            try:
+                meta_store = PreloadedMetadataStore(store)
+            except Exception as e:  # e.g., listing the bucket is not permitted
+                self.logger.debug("Could not preload the metadata of %s: %s" % (self.source, e))
+                meta_store = None
+            # Listing is not supported by all servers, in which case the listing is empty
+            if meta_store is not None and ('.zgroup' in meta_store or '.zarray' in meta_store):
+                self.__metadata_stores[id(store)] = meta_store
+                store.set_metadata_store(meta_store.meta_store)
+                return zarr.open(store=meta_store,
+                                 chunk_store=store,
+                                 mode=mode,
+                                 synchronizer=synchronizer)
+        return zarr.open(store=store,
+                         mode=mode,
+                         synchronizer=synchronizer,
+                         storage_options=storage_options)
 
     @docval({'name': 'parent', 'type': Group, 'doc': 'the parent Zarr object'},
             {'name': 'builder', 'type': GroupBuilder, 'doc': 'the GroupBuilder to write'},
@@ -515,11 +708,26 @@ class ZarrIO(HDMFIO):
              'doc': 'The source of the builders when exporting', 'default': None},
             returns='the Group that was created', rtype='Group')
     def write_group(self, **kwargs):
-        """Write a GroupBuider to file"""
+        """
+        Write a GroupBuider to file
+
+        The metadata of the group and of all groups and datasets within it is held back by a
+        :py:class:`~hdmf_zarr.storage.BatchedMetadataStore` and written at once after the group has been written.
+        """
         parent, builder, link_data, exhaust_dci, export_source = getargs(
             'parent', 'builder', 'link_data', 'exhaust_dci', 'export_source', kwargs
         )
+        if isinstance(parent.store, BatchedMetadataStore):
+            return self.__write_group(parent, builder, link_data, exhaust_dci, export_source)
+        batched_store = BatchedMetadataStore(parent.store)
+        try:
+            return self.__write_group(Group(store=batched_store, path=parent.path, synchronizer=parent.synchronizer),
+                                      builder, link_data, exhaust_dci, export_source)
+        finally:
+            # Stop batching, as datasets of the group may still be written to when exhausting queued iterators
+            batched_store.close()
 
+    def __write_group(self, parent, builder, link_data, exhaust_dci, export_source):
         if self.get_written(builder):
             group = parent[builder.name]
         else:
@@ -564,9 +772,15 @@ class ZarrIO(HDMFIO):
             {'name': 'export_source', 'type': str,
              'doc': 'The source of the builders when exporting', 'default': None})
     def write_attributes(self, **kwargs):
-        """Set (i.e., write) the attributes on a given Zarr Group or Array."""
+        """
+        Set (i.e., write) the attributes on a given Zarr Group or Array.
+
+        All attributes are written with a single update of the attributes of the object, rather than
+        rewriting the ``.zattrs`` of the object once for every attribute.
+        """
         obj, attributes, export_source = getargs('obj', 'attributes', 'export_source', kwargs)
 
+        attributes_to_write = dict()
         for key, value in attributes.items():
             # Case 1: list, set, tuple type attributes
             if isinstance(value, (set, list, tuple)) or (isinstance(value, np.ndarray) and np.ndim(value) != 0):
@@ -577,7 +791,7 @@ class ZarrIO(HDMFIO):
                     tmp = tuple(value)
                 # Attempt write of the attribute
                 try:
-                    obj.attrs[key] = tmp
+                    attributes_to_write[key] = self.__check_json_serializable(tmp)
                 # Numpy scalars and bytes are not JSON serializable. Try to convert to a serializable type instead
                 except TypeError as e:
                     try:
@@ -587,7 +801,7 @@ class ZarrIO(HDMFIO):
                                      if isinstance(i, (bytes, np.bytes_))
                                      else i
                                      for i in value])
-                        obj.attrs[key] = tmp
+                        attributes_to_write[key] = self.__check_json_serializable(tmp)
                     except:  # noqa: E722
                         raise TypeError(str(e) + " type=" + str(type(value)) + "  data=" + str(value)) from e
             # Case 2: References
@@ -603,12 +817,12 @@ class ZarrIO(HDMFIO):
                     else:
                         refs = self._create_ref(value.builder, export_source)
                 tmp = {'zarr_dtype': type_str, 'value': refs}
-                obj.attrs[key] = tmp
+                attributes_to_write[key] = tmp
             # Case 3: Scalar attributes
             else:
                 # Attempt to write the attribute
                 try:
-                    obj.attrs[key] = value
+                    attributes_to_write[key] = self.__check_json_serializable(value)
                 # Numpy scalars and bytes are not JSON serializable. Try to convert to a serializable type instead
                 except TypeError as e:
                     try:
@@ -618,10 +832,18 @@ class ZarrIO(HDMFIO):
                             else val.decode("utf-8") \
                             if isinstance(value, (bytes, np.bytes_)) \
                             else val
-                        obj.attrs[key] = val
+                        attributes_to_write[key] = self.__check_json_serializable(val)
                     except:  # noqa: E722
                         msg = str(e) + "key=" + key + " type=" + str(type(value)) + "  data=" + str(value)
                         raise TypeError(msg) from e
+        if attributes_to_write:
+            obj.attrs.update(attributes_to_write)
+
+    @staticmethod
+    def __check_json_serializable(value):
+        """Return the value if it can be written as a Zarr attribute (i.e., to JSON) and raise a TypeError otherwise"""
+        json_dumps(value)
+        return value
 
     def __get_path(self, builder):
         """Get the path to the builder.
@@ -1129,6 +1351,9 @@ class ZarrIO(HDMFIO):
         # Exhaust the DataChunkIterator if the dataset was given this way. Note this is a no-op
         # if the self.__dci_queue is empty
         if exhaust_dci:
+            # Worker processes of parallel writes open the dataset from the underlying store
+            if self.__dci_queue and isinstance(parent.store, BatchedMetadataStore):
+                parent.store.flush()
             self.__dci_queue.exhaust_queue()
         return dset
 
@@ -30,6 +30,8 @@ try:
             path, mode, manager, extensions, load_namespaces, synchronizer, storage_options = \
                 popargs('path', 'mode', 'manager', 'extensions',
                         'load_namespaces', 'synchronizer', 'storage_options', kwargs)
+            max_concurrent_reads, remote_store, direct_io, io_uring, preload_metadata = popargs(
+                'max_concurrent_reads', 'remote_store', 'direct_io', 'io_uring', 'preload_metadata', kwargs)
 
             io_modes_that_create_file = ['w', 'w-', 'x']
             if mode in io_modes_that_create_file or manager is not None or extensions is not None:
@@ -50,7 +52,12 @@ try:
                                             manager=manager,
                                             mode=mode,
                                             synchronizer=synchronizer,
-                                            storage_options=storage_options)
+                                            storage_options=storage_options,
+                                            max_concurrent_reads=max_concurrent_reads,
+                                            remote_store=remote_store,
+                                            direct_io=direct_io,
+                                            io_uring=io_uring,
+                                            preload_metadata=preload_metadata)
 
         @docval({'name': 'src_io', 'type': HDMFIO, 'doc': 'the HDMFIO object for reading the data to export'},
                 {'name': 'nwbfile', 'type': 'NWBFile',
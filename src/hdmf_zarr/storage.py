@@ -0,0 +1,939 @@
+"""Collection of Zarr storage classes used by the ZarrIO backend to access local and remote files."""
+import json
+import math
+import errno
+import mmap
+import os
+import shutil
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock, local
+
+import numpy as np
+from numcodecs.compat import ensure_bytes, ensure_contiguous_ndarray
+from zarr.errors import ReadOnlyError
+from zarr.storage import (ConsolidatedMetadataStore, DirectoryStore, FSStore, KVStore, Store, getsize, listdir,
+                          normalize_storage_path, rmdir)
+from zarr.util import json_loads
+
+
+DEFAULT_CACHE_SIZE = 32 << 20
+"""
+Default maximum size in bytes of the values cached by the read-only remote stores (32 MiB)
+"""
+
+DEFAULT_MAX_CONCURRENT_READS = 16
+"""
+Default number of threads reading concurrently from synchronous filesystems and via pyarrow
+"""
+
+S3_MAX_POOL_CONNECTIONS = 10
+"""
+Default number of connections kept alive in the connection pool of ``s3fs`` (i.e., of botocore)
+"""
+
+DIRECT_IO_MIN_SIZE = 4096
+"""
+Minimum size in bytes of the values written with direct I/O by :py:class:`DirectDirectoryStore`
+"""
+
+URING_MAX_REGISTERED_SIZE = 8 << 20
+"""
+Default maximum size in bytes of the buffers registered with io_uring by :py:class:`UringDirectoryStore` (8 MiB)
+"""
+
+METADATA_KEYS = ('.zgroup', '.zattrs', '.zarray')
+"""
+Names of the keys storing the metadata of groups and arrays in a Zarr store
+"""
+
+
+class _ReadCache:
+    """
+    Least-recently-used cache of the values read from a read-only store, bounded by the total size of the values.
+
+    Reading a remote file opens the file again for every reference and link that is resolved, which
+    reads the same small metadata objects (e.g., ``.zmetadata``, ``.zgroup``, and ``.zattrs``) many times.
+    Caching the values avoids issuing a request for each of these repeated reads.
+
+    If prefetching is enabled, then the cache detects when the chunks of an array are read sequentially
+    (i.e., each read starts at the chunk following the last chunk of the previous read) and reads the
+    next chunk in the background while the current chunks are being decoded. Prefetching requires the
+    metadata of the array (i.e., ``.zarray``) to be cached, which is the case once the array has been opened,
+    or to be available from :py:attr:`meta_store`, e.g., the consolidated metadata the file was opened with.
+
+    :param max_size: Maximum total size in bytes of the cached values
+    :param prefetch: Read the next chunk in the background when reading chunks sequentially
+    :param max_prefetch: Maximum number of chunk reads in flight in the background
+    """
+
+    def __init__(self, max_size, prefetch=False, max_prefetch=8):
+        self.max_size = max_size
+        self.prefetch = prefetch
+        self.max_prefetch = max_prefetch
+        self.__values = OrderedDict()
+        self.__size = 0
+        self.__lock = Lock()
+        self.__array_meta = dict()  # parsed .zarray metadata of arrays by path
+        self.__next_chunk = dict()  # index of the chunk following the last chunk read by array path
+        self.__prefetching = dict()  # futures of the chunks being prefetched by key
+        self.__executor = None
+        self.meta_store = None  # metadata of the arrays that are not read via the cache, e.g., consolidated metadata
+
+    def __getstate__(self):
+        # Locks cannot be pickled, and the cached values need not be sent along with the store
+        return {'max_size': self.max_size, 'prefetch': self.prefetch, 'max_prefetch': self.max_prefetch}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __contains__(self, key):
+        return key in self.__values
+
+    def get(self, key):
+        """Get the cached value for the key or None if the key is not cached"""
+        with self.__lock:
+            value = self.__values.get(key)
+            if value is not None:
+                self.__values.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Add the value to the cache, evicting the least recently used values if necessary"""
+        nbytes = len(value)
+        if nbytes > self.max_size:
+            return
+        with self.__lock:
+            if key in self.__values:
+                return
+            self.__values[key] = value
+            self.__size += nbytes
+            while self.__size > self.max_size:
+                _, evicted = self.__values.popitem(last=False)
+                self.__size -= len(evicted)
+
+    def getitem(self, key, read):
+        """Get the value for the key from the cache or via the given read function if the key is not cached"""
+        self.__wait_for_prefetch([key])
+        value = self.get(key)
+        if value is None:
+            value = read(key)
+            self.put(key, value)
+        self.__prefetch_next([key], read)
+        return value
+
+    def getitems(self, keys, read):
+        """Get the values for the keys from the cache and via the given read function for keys that are not cached"""
+        self.__wait_for_prefetch(keys)
+        values = dict()
+        missing = list()
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        if len(missing) > 0:
+            read_values = read(missing)
+            for key, value in read_values.items():
+                self.put(key, value)
+            values.update(read_values)
+        self.__prefetch_next(keys, lambda key: read([key])[key])
+        return values
+
+    def __wait_for_prefetch(self, keys):
+        """Wait for the prefetching of any of the given keys to complete"""
+        if not self.prefetch:
+            return
+        with self.__lock:
+            futures = [self.__prefetching[key] for key in keys if key in self.__prefetching]
+        for future in futures:
+            future.result()
+
+    def __prefetch(self, key, read):
+        try:
+            self.put(key, read(key))
+        except Exception:
+            # The chunk is missing (i.e., the fill value is used) or could not be read, in which case
+            # the error is raised when the chunk is read as part of a regular read
+            pass
+        finally:
+            with self.__lock:
+                self.__prefetching.pop(key, None)
+
+    def __prefetch_next(self, keys, read):
+        """Read the chunk following the given chunks in the background if the chunks are read sequentially"""
+        if not self.prefetch:
+            return
+        chunks = dict()
+        for key in keys:
+            chunk = self.__parse_chunk_key(key)
+            if chunk is not None:
+                chunks.setdefault(chunk[0], list()).append(chunk[1])
+        for path, indices in chunks.items():
+            meta = self.__array_meta[path]
+            sequential = min(indices) in (self.__next_chunk.get(path), (0, ) * len(meta['shape']))
+            next_index = self.__get_next_chunk_index(meta, max(indices))
+            self.__next_chunk[path] = next_index
+            if not sequential or next_index is None:
+                continue
+            separator = meta.get('dimension_separator') or '.'
+            next_key = (path + '/' if path else '') + separator.join(map(str, next_index))
+            with self.__lock:
+                if (next_key in self.__values or next_key in self.__prefetching or
+                        len(self.__prefetching) >= self.max_prefetch):
+                    continue
+                if self.__executor is None:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.max_prefetch)
+                self.__prefetching[next_key] = self.__executor.submit(self.__prefetch, next_key, read)
+
+    def __parse_chunk_key(self, key):
+        """
+        Get the path of the array and the index of the chunk for the given key.
+
+        :returns: Tuple with the path and index of the chunk or None if the key is not a chunk of an array
+                  for which the metadata has been cached
+        """
+        parts = key.split('/')
+        for i in range(len(parts) - 1, -1, -1):
+            path = '/'.join(parts[:i])
+            if path not in self.__array_meta:
+                meta = self.__get_array_meta(path + '/.zarray' if path else '.zarray')
+                if meta is None:
+                    continue
+                self.__array_meta[path] = meta
+            meta = self.__array_meta[path]
+            separator = meta.get('dimension_separator') or '.'
+            index = '/'.join(parts[i:]).split(separator)
+            if len(meta['shape']) == 0 or len(index) != len(meta['shape']) or not all(x.isdigit() for x in index):
+                return None
+            return path, tuple(int(x) for x in index)
+        return None
+
+    def __get_array_meta(self, key):
+        """Get the parsed metadata of an array from the cache or the meta store or None if it is not available"""
+        meta = self.get(key)
+        if meta is None and self.meta_store is not None:
+            meta = self.meta_store.get(key)
+        if meta is None:
+            return None
+        # The meta stores of zarr (e.g., of consolidated metadata) hold the metadata already parsed
+        return meta if isinstance(meta, dict) else json.loads(meta)
+
+    @staticmethod
+    def __get_next_chunk_index(meta, index):
+        """Get the index of the chunk following the given chunk in C order or None if it is the last chunk"""
+        num_chunks = [math.ceil(s / c) for s, c in zip(meta['shape'], meta['chunks'])]
+        next_index = list(index)
+        for dim in reversed(range(len(next_index))):
+            next_index[dim] += 1
+            if next_index[dim] < num_chunks[dim]:
+                return tuple(next_index)
+            next_index[dim] = 0
+        return None
+
+
+class _CachedConcurrentReadsMixin:
+    """
+    Mixin for the read-only remote stores that reads multiple keys concurrently and caches the values read.
+
+    The stores only implement :py:meth:`_read` and :py:meth:`_contains` for a single key. :py:meth:`getitems`
+    reads the keys concurrently from a thread pool with ``max_concurrent_reads`` workers, which is created on
+    first use and reused for all reads of the store. Stores that can read many keys more efficiently (e.g.,
+    asynchronously) override :py:meth:`_read_many`. The values read are kept in a :py:class:`_ReadCache`.
+    """
+
+    def _init_reads(self, max_concurrent_reads, cache_size, prefetch):
+        """Initialize the reads with the given maximum number of reads in flight and cache size (0 disables caching)"""
+        if max_concurrent_reads is not None and max_concurrent_reads < 1:
+            raise ValueError("max_concurrent_reads must be a positive integer")
+        self.max_concurrent_reads = max_concurrent_reads
+        self.__cache = _ReadCache(cache_size, prefetch=prefetch) if cache_size > 0 else None
+        self.__init_executor()
+
+    def __init_executor(self):
+        self.__executor = None  # thread pool for concurrent reads, created on first use
+        self.__executor_lock = Lock()
+
+    def __getstate__(self):
+        # Thread pools and locks cannot be pickled, and the thread pool is created again as needed
+        state = self.__dict__.copy()
+        for attr in ('executor', 'executor_lock'):
+            del state['_CachedConcurrentReadsMixin__' + attr]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_executor()
+
+    def _read(self, key):
+        """Read the value for the key, raising a KeyError if the key does not exist"""
+        raise NotImplementedError
+
+    def _contains(self, key):
+        """Check whether the key exists without reading its value"""
+        raise NotImplementedError
+
+    def __read_or_none(self, key):
+        try:
+            return self._read(key)
+        except KeyError:
+            return None
+
+    def __get_executor(self):
+        """Get the thread pool for concurrent reads, which is reused rather than starting new threads per read"""
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrent_reads or DEFAULT_MAX_CONCURRENT_READS)
+            return self.__executor
+
+    def _read_many(self, keys):
+        """Read the values for the given keys concurrently, omitting keys that do not exist"""
+        keys = list(keys)
+        if len(keys) == 0:
+            return {}
+        values = self.__get_executor().map(self.__read_or_none, keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def __getitem__(self, key):
+        if self.__cache is None:
+            return self._read(key)
+        return self.__cache.getitem(key, self._read)
+
+    def __contains__(self, key):
+        if self.__cache is not None and key in self.__cache:
+            return True
+        return self._contains(key)
+
+    def getitems(self, keys, **kwargs):
+        """Read the values for the given keys concurrently, omitting keys that are missing in the store"""
+        if self.__cache is None:
+            return self._read_many(keys)
+        return self.__cache.getitems(keys, self._read_many)
+
+    def set_metadata_store(self, meta_store):
+        """
+        Use the metadata in the given store to detect sequential reads of chunks for prefetching.
+
+        Metadata that are read from another store (e.g., consolidated metadata) do not pass through
+        the cache of this store, such that the chunks of these arrays would otherwise not be prefetched.
+
+        :param meta_store: Store with the metadata of the arrays, e.g., the ``meta_store`` of a
+                           :py:class:`~zarr.storage.ConsolidatedMetadataStore`
+        """
+        if self.__cache is not None:
+            self.__cache.meta_store = meta_store
+
+
+class ConcurrentFSStore(_CachedConcurrentReadsMixin, FSStore):
+    """
+    FSStore that caches the values read and issues the reads of multiple chunks concurrently for all filesystems.
+
+    When reading a selection that spans several chunks, Zarr requests all chunks at once via
+    :py:meth:`getitems`. For asynchronous filesystems (e.g., ``s3fs`` or ``http``), :py:class:`~zarr.storage.FSStore`
+    already gathers these requests on the fsspec event loop (in batches of 1280 by default), which is kept as is
+    unless ``max_concurrent_reads`` is set to limit the number of requests in flight. For synchronous filesystems,
+    which :py:class:`~zarr.storage.FSStore` reads one chunk at a time, the requests are dispatched to a thread pool
+    with ``max_concurrent_reads`` workers (:py:data:`DEFAULT_MAX_CONCURRENT_READS` by default).
+    Reading from object stores is latency-bound, such that overlapping requests reduces the time
+    needed to read many chunks. If the store is opened read-only (i.e., ``mode="r"``), then the values
+    read are kept in an in-memory cache of up to ``cache_size`` bytes to avoid reading the same values
+    (in particular the metadata) repeatedly. When the chunks of an array are read sequentially, e.g., when
+    iterating over an array one chunk at a time, the next chunk is prefetched in the background to overlap
+    the latency of the request with decoding the current chunk.
+
+    Requests reuse the keep-alive connections of the connection pool of the filesystem rather than opening
+    a new connection (with a new TLS handshake) per request. Via the instance cache of fsspec, all stores
+    created with the same storage options share the same filesystem and thus its connections. For ``s3://``
+    URLs, the pool of ``s3fs`` is enlarged to ``max_concurrent_reads`` connections, if given, unless
+    ``max_pool_connections`` is set explicitly via ``config_kwargs``, as requests exceeding the size of the
+    pool would otherwise wait for a free connection.
+
+    :param url: The destination to map, including the protocol, e.g., ``s3://bucket/root``
+    :param max_concurrent_reads: Maximum number of reads in flight at any time. The default is None, i.e., the
+                                 batch size of fsspec for asynchronous filesystems and
+                                 :py:data:`DEFAULT_MAX_CONCURRENT_READS` for synchronous filesystems.
+    :param cache_size: Maximum size in bytes of the values cached in read-only mode. Set to 0 to disable caching.
+                       The default is :py:data:`DEFAULT_CACHE_SIZE` (32 MiB).
+    :param prefetch: Prefetch the next chunk when reading chunks sequentially in read-only mode. Requires caching.
+    :param kwargs: Additional keyword arguments passed to :py:class:`zarr.storage.FSStore`
+    """
+
+    def __init__(self, url, max_concurrent_reads=None, cache_size=DEFAULT_CACHE_SIZE, prefetch=True, **kwargs):
+        # Only values read in read-only mode can be cached, as they may be changed otherwise
+        self._init_reads(max_concurrent_reads, cache_size if kwargs.get("mode", "w") == "r" else 0, prefetch)
+        if (url.startswith(("s3://", "s3a://")) and max_concurrent_reads is not None
+                and max_concurrent_reads > S3_MAX_POOL_CONNECTIONS):
+            config_kwargs = dict(kwargs.get("config_kwargs") or {})
+            config_kwargs.setdefault("max_pool_connections", max_concurrent_reads)
+            kwargs["config_kwargs"] = config_kwargs
+        super().__init__(url, **kwargs)
+
+    def _read(self, key):
+        return FSStore.__getitem__(self, key)
+
+    def _contains(self, key):
+        return FSStore.__contains__(self, key)
+
+    def _read_many(self, keys):
+        if not self.fs.async_impl:
+            return super()._read_many(keys)
+        keys_transformed = {self._normalize_key(key): key for key in keys}
+        paths = {self.map._key_to_str(key): key for key in keys_transformed}
+        if len(paths) == 0:
+            return {}
+        # Without an explicit limit, use the batch size of fsspec as FSStore does
+        kwargs = {} if self.max_concurrent_reads is None else {"batch_size": self.max_concurrent_reads}
+        results = self.fs.cat(list(paths), on_error="return", **kwargs)
+        values = {}
+        for path, value in results.items():
+            if isinstance(value, self.exceptions):
+                # Missing keys are omitted so that the calling function raises a KeyError (i.e., uses the fill value)
+                continue
+            elif isinstance(value, Exception):
+                raise value
+            else:
+                values[keys_transformed[paths[path]]] = value
+        return values
+
+
+@lru_cache(maxsize=None)
+def _resolve_s3_region(bucket):
+    """Look up (and cache) the region of an S3 bucket to avoid repeated lookups when resolving references"""
+    from pyarrow.fs import resolve_s3_region
+    return resolve_s3_region(bucket)
+
+
+@lru_cache(maxsize=None)
+def _get_s3_filesystem(options):
+    """Create (and cache) a pyarrow S3FileSystem such that stores with the same options share its connections"""
+    from pyarrow.fs import S3FileSystem
+    return S3FileSystem(**dict(options))
+
+
+class ArrowFSStore(_CachedConcurrentReadsMixin, Store):
+    """
+    Read-only Zarr store based on a :py:class:`pyarrow.fs.FileSystem`, e.g., for reading from S3.
+
+    In contrast to fsspec, which runs requests as Python coroutines on its event loop, all requests of
+    pyarrow filesystems are run in C++ without holding the GIL. Reads of multiple chunks requested
+    via :py:meth:`getitems` are issued concurrently from a thread pool with ``max_concurrent_reads``
+    workers. As for :py:class:`ConcurrentFSStore`, the values read are kept in an in-memory cache of
+    up to ``cache_size`` bytes and the next chunk is prefetched when reading chunks sequentially.
+    Requires ``pyarrow`` to be installed.
+
+    :param path: Path to the root of the Zarr file within the filesystem, e.g., ``bucket/root`` for S3
+    :param filesystem: The pyarrow filesystem to read from
+    :param max_concurrent_reads: Maximum number of reads in flight at any time. The default is
+                                 :py:data:`DEFAULT_MAX_CONCURRENT_READS` (16).
+    :param cache_size: Maximum size in bytes of the cached values. Set to 0 to disable caching.
+                       The default is :py:data:`DEFAULT_CACHE_SIZE` (32 MiB).
+    :param prefetch: Prefetch the next chunk when reading chunks sequentially. Requires caching.
+    """
+
+    _writeable = False
+    _erasable = False
+
+    def __init__(self, path, filesystem, max_concurrent_reads=DEFAULT_MAX_CONCURRENT_READS,
+                 cache_size=DEFAULT_CACHE_SIZE, prefetch=True):
+        if max_concurrent_reads is None:
+            max_concurrent_reads = DEFAULT_MAX_CONCURRENT_READS
+        self._init_reads(max_concurrent_reads, cache_size, prefetch)
+        self.path = path.rstrip("/")
+        self.fs = filesystem
+
+    @classmethod
+    def from_url(cls, url, max_concurrent_reads=DEFAULT_MAX_CONCURRENT_READS, cache_size=DEFAULT_CACHE_SIZE,
+                 **storage_options):
+        """
+        Create an ArrowFSStore for reading from the given ``s3://`` URL.
+
+        :param url: The URL of the Zarr file, e.g., ``s3://bucket/root``
+        :param max_concurrent_reads: Maximum number of reads in flight at any time. The default is
+                                     :py:data:`DEFAULT_MAX_CONCURRENT_READS` (16).
+        :param cache_size: Maximum size in bytes of the cached values. Set to 0 to disable caching.
+        :param storage_options: Keyword arguments passed to :py:class:`pyarrow.fs.S3FileSystem`. For consistency
+                                with the storage_options of s3fs, ``anon`` is accepted as alias for ``anonymous``.
+                                If no ``region`` is given, then the region of the bucket is determined automatically.
+
+        Stores created with the same storage_options share one :py:class:`pyarrow.fs.S3FileSystem`, such that
+        opening another file (e.g., to resolve references or with another ZarrIO) reuses its open connections
+        rather than connecting (and negotiating TLS) again.
+        """
+        try:
+            from pyarrow.fs import S3FileSystem
+        except ImportError:
+            raise ImportError("pyarrow is required for reading files with ArrowFSStore")
+        if not url.startswith("s3://"):
+            raise ValueError("ArrowFSStore.from_url only supports s3:// URLs, received %s" % url)
+        path = url[len("s3://"):].rstrip("/")
+        storage_options = dict(storage_options)
+        if "anon" in storage_options:
+            storage_options["anonymous"] = storage_options.pop("anon")
+        if "region" not in storage_options:
+            storage_options["region"] = _resolve_s3_region(path.split("/")[0])
+        try:
+            filesystem = _get_s3_filesystem(tuple(sorted(storage_options.items())))
+        except TypeError:  # options that cannot be cached, e.g., lists
+            filesystem = S3FileSystem(**storage_options)
+        return cls(path, filesystem,
+                   max_concurrent_reads=max_concurrent_reads,
+                   cache_size=cache_size)
+
+    def __key_to_path(self, key):
+        key = normalize_storage_path(key)
+        return "%s/%s" % (self.path, key) if key else self.path
+
+    def _read(self, key):
+        try:
+            with self.fs.open_input_stream(self.__key_to_path(key)) as f:
+                return f.read()
+        except OSError as e:
+            # Treat errors the same as FSStore, e.g., S3 responds with 403 for missing keys for anonymous access
+            raise KeyError(key) from e
+
+    def _contains(self, key):
+        from pyarrow.fs import FileType
+        return self.fs.get_file_info(self.__key_to_path(key)).type == FileType.File
+
+    def __iter__(self):
+        from pyarrow.fs import FileSelector, FileType
+        selector = FileSelector(self.path, allow_not_found=True, recursive=True)
+        for info in self.fs.get_file_info(selector):
+            if info.type == FileType.File:
+                yield info.path[len(self.path) + 1:]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def listdir(self, path=None):
+        from pyarrow.fs import FileSelector
+        selector = FileSelector(self.__key_to_path(path or ""), allow_not_found=True)
+        return sorted(info.base_name for info in self.fs.get_file_info(selector))
+
+    def __setitem__(self, key, value):
+        raise ReadOnlyError()
+
+    def __delitem__(self, key):
+        raise ReadOnlyError()
+
+
+class PreloadedMetadataStore(ConsolidatedMetadataStore):
+    """
+    Read-only layer over a store without consolidated metadata that reads all metadata up front.
+
+    Opening a file without consolidated metadata (i.e., without ``.zmetadata``) reads the ``.zgroup``,
+    ``.zattrs``, and ``.zarray`` of every group and array one at a time, each of which is a separate
+    request for remote files. Instead, this store lists the keys of the store once and reads all
+    metadata concurrently via :py:meth:`~zarr.storage.BaseStore.getitems`. As for
+    :py:class:`~zarr.storage.ConsolidatedMetadataStore`, the metadata are then served from memory
+    and the chunks need to be read from the underlying store, e.g., via the ``chunk_store``
+    argument of :py:func:`zarr.open`.
+
+    Listing the store also lists all chunks, such that this is only beneficial if the file does not
+    consist of a much larger number of chunks than of groups and arrays.
+
+    :param store: The store containing the Zarr file
+    """
+
+    def __init__(self, store):
+        self.store = Store._ensure_store(store)
+        keys = [key for key in self.store.keys() if key.rsplit('/', 1)[-1] in METADATA_KEYS]
+        values = self.store.getitems(keys, contexts={})
+        self.meta_store = KVStore({key: json_loads(value) for key, value in values.items()})
+
+
+class BatchedMetadataStore(Store):
+    """
+    Layer over another store that holds back writes of metadata until :py:meth:`flush` is called.
+
+    Creating a group or an array and setting its attributes writes the ``.zgroup``, ``.zarray``, and
+    ``.zattrs`` of each object with separate writes, several of them for the same key. This store keeps
+    the latest value of each metadata key in memory, serves reads of these keys from memory, and
+    :py:meth:`flush` writes all of them with a single call of the ``setitems`` method of the underlying
+    store, if available, e.g., batched via io_uring by :py:class:`UringDirectoryStore` or concurrently by
+    :py:class:`~zarr.storage.FSStore`. All other values (i.e., chunks) are written to the underlying store
+    right away. :py:meth:`close` flushes the pending metadata and stops holding back writes, such that
+    arrays that are written to later on (e.g., resized when exhausting a data chunk iterator) still write
+    their metadata to the underlying store.
+
+    :param store: The store to write to
+    """
+
+    def __init__(self, store):
+        self.store = Store._ensure_store(store)
+        self.pending = dict()  # metadata that has not been written to the underlying store yet
+        self.batching = True  # whether writes of metadata are held back
+        self._dimension_separator = getattr(self.store, '_dimension_separator', None)
+
+    @property
+    def path(self):
+        """Path of the underlying store"""
+        return self.store.path
+
+    def flush(self):
+        """Write all pending metadata to the underlying store"""
+        values, self.pending = self.pending, dict()
+        self.__setitems(values)
+
+    def close(self):
+        """Write all pending metadata to the underlying store and write all values through from now on"""
+        self.flush()
+        self.batching = False
+
+    def __setitems(self, values):
+        if not values:
+            return
+        if hasattr(self.store, 'setitems'):
+            self.store.setitems(values)
+        else:
+            for key, value in values.items():
+                self.store[key] = value
+
+    def __is_metadata(self, key):
+        """Whether the write of the key is held back"""
+        return self.batching and key.rsplit('/', 1)[-1] in METADATA_KEYS
+
+    def __getitem__(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        return self.store[key]
+
+    def getitems(self, keys, **kwargs):
+        """Read the values for the given keys, omitting keys that are missing in the store"""
+        values = {key: self.pending[key] for key in keys if key in self.pending}
+        keys = [key for key in keys if key not in self.pending]
+        if hasattr(self.store, 'getitems'):
+            # The keyword arguments depend on the version of zarr, e.g., contexts or on_error (before zarr 2.15)
+            values.update(self.store.getitems(keys, **kwargs))
+        else:
+            values.update({key: self.store[key] for key in keys if key in self.store})
+        return values
+
+    def __setitem__(self, key, value):
+        if self.__is_metadata(key):
+            self.pending[key] = value
+        else:
+            self.store[key] = value
+
+    def setitems(self, values):
+        self.pending.update({key: value for key, value in values.items() if self.__is_metadata(key)})
+        self.__setitems({key: value for key, value in values.items() if not self.__is_metadata(key)})
+
+    def __delitem__(self, key):
+        if self.pending.pop(key, None) is None:
+            del self.store[key]
+        elif key in self.store:
+            del self.store[key]
+
+    def __contains__(self, key):
+        return key in self.pending or key in self.store
+
+    def __iter__(self):
+        yield from self.pending
+        yield from (key for key in self.store if key not in self.pending)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def listdir(self, path=None):
+        children = set(listdir(self.store, path))
+        path = normalize_storage_path(path)
+        prefix = path + '/' if path else ''
+        children.update(key[len(prefix):].split('/', 1)[0] for key in self.pending if key.startswith(prefix))
+        return sorted(children)
+
+    def rmdir(self, path=None):
+        path = normalize_storage_path(path)
+        prefix = path + '/' if path else ''
+        for key in [key for key in self.pending if key.startswith(prefix)]:
+            del self.pending[key]
+        rmdir(self.store, path)
+
+    def getsize(self, path=None):
+        self.flush()
+        return getsize(self.store, path)
+
+
+class DirectDirectoryStore(DirectoryStore):
+    """
+    DirectoryStore that writes values with direct I/O (i.e., ``O_DIRECT``), bypassing the page cache.
+
+    Writing chunks through the page cache copies every chunk into kernel memory first and leaves the
+    written chunks cached, which is wasted effort when writing large files that are not read again
+    right away. Direct I/O requires the memory, offset, and size of each write to be aligned to the
+    block size of the device. Each value is therefore copied into a page-aligned buffer, which is
+    allocated once per thread and reused across writes, written with its size rounded up to the next
+    page, and the file is then truncated to the size of the value.
+
+    Values smaller than :py:data:`DIRECT_IO_MIN_SIZE` (e.g., metadata), where direct I/O does not pay
+    off, are written with buffered I/O, as are all values on platforms or filesystems that do not
+    support ``O_DIRECT``. Reads are not affected.
+
+    :param path: Location of directory to use as the root of the storage hierarchy
+    :param normalize_keys: If True, all store keys will be normalized to use lower case characters
+    :param dimension_separator: Separator placed between the dimensions of a chunk
+    """
+
+    def __init__(self, path, normalize_keys=False, dimension_separator=None):
+        super().__init__(path, normalize_keys=normalize_keys, dimension_separator=dimension_separator)
+        self.__local = local()  # page-aligned write buffer of each thread
+
+    def __getstate__(self):
+        # The write buffers cannot be pickled and are allocated again as needed
+        state = self.__dict__.copy()
+        del state['_DirectDirectoryStore__local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__local = local()
+
+    def __get_buffer(self, size):
+        """Get the page-aligned write buffer of the current thread with at least the given size"""
+        buffer = getattr(self.__local, 'buffer', None)
+        if buffer is None or len(buffer) < size:
+            if buffer is not None:
+                buffer.close()
+            buffer = mmap.mmap(-1, size)  # anonymous memory maps are page-aligned
+            self.__local.buffer = buffer
+        return buffer
+
+    def _tofile(self, a, fn):
+        nbytes = a.nbytes
+        if nbytes < DIRECT_IO_MIN_SIZE or not hasattr(os, 'O_DIRECT'):
+            return super()._tofile(a, fn)
+        try:
+            fd = os.open(fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o666)
+        except OSError:  # The filesystem does not support direct I/O (e.g., tmpfs)
+            return super()._tofile(a, fn)
+        try:
+            size = -(-nbytes // mmap.PAGESIZE) * mmap.PAGESIZE
+            buffer = self.__get_buffer(size)
+            view = memoryview(buffer)
+            try:
+                view[:nbytes] = np.asarray(a).view(np.uint8)
+                offset = 0
+                while offset < size:
+                    offset += os.pwrite(fd, view[offset:size], offset)
+            finally:
+                view.release()
+            os.ftruncate(fd, nbytes)
+        finally:
+            os.close(fd)
+
+
+def _io_uring_queue_exit(rings):
+    """Release the given io_uring instances"""
+    from liburing import io_uring_queue_exit
+    while rings:
+        io_uring_queue_exit(rings.pop())
+
+
+class UringDirectoryStore(DirectoryStore):
+    """
+    DirectoryStore that writes the chunks of a selection with batched io_uring submissions on Linux.
+
+    Zarr writes all chunks touched by a selection via :py:meth:`setitems`. Instead of issuing one ``write``
+    system call per chunk, this store prepares one io_uring write request per chunk, submits up to
+    ``queue_depth`` requests with a single system call, and then waits for their completions. As for
+    :py:class:`~zarr.storage.DirectoryStore`, each value is written to a temporary file that is then
+    moved into place. Single values (e.g., metadata) are written as by
+    :py:class:`~zarr.storage.DirectoryStore`.
+
+    If all values of a batch have the same size, as is the case for the chunks of an array without compressor,
+    then the values are copied into buffers that are registered with io_uring once and written with
+    ``IORING_OP_WRITE_FIXED``, which saves the kernel from pinning the pages of each value for every write.
+    The buffers are registered again only if the size of the values changes.
+
+    By default, each io_uring instance is set up with ``IORING_SETUP_SQPOLL`` such that a kernel thread polls
+    the submission queue and submitting the writes of a batch does not require a system call. The kernel
+    thread stops polling after one second without submissions. If polling is not supported (e.g., on older
+    kernels without the required privileges), the io_uring instances are set up without it.
+
+    Requires the ``liburing`` package and a kernel with io_uring support (Linux 5.1 or newer). If io_uring
+    is not available (e.g., on other platforms or if io_uring is disabled by the system), then all values
+    are written as by :py:class:`~zarr.storage.DirectoryStore`. Each thread uses its own io_uring instance.
+    Call :py:meth:`close` to release them.
+
+    :param path: Location of directory to use as the root of the storage hierarchy
+    :param normalize_keys: If True, all store keys will be normalized to use lower case characters
+    :param dimension_separator: Separator placed between the dimensions of a chunk
+    :param queue_depth: Maximum number of write requests submitted at once. The default is 64.
+    :param max_registered_size: Maximum size in bytes of the buffers registered by each thread. Values that do
+                                not fit are written without registered buffers. Set to 0 to disable registered
+                                buffers. The default is :py:data:`URING_MAX_REGISTERED_SIZE`.
+    :param sqpoll: Poll the submission queues with kernel threads if supported. The default is True.
+    """
+
+    def __init__(self, path, normalize_keys=False, dimension_separator=None, queue_depth=64,
+                 max_registered_size=URING_MAX_REGISTERED_SIZE, sqpoll=True):
+        super().__init__(path, normalize_keys=normalize_keys, dimension_separator=dimension_separator)
+        self.queue_depth = queue_depth
+        self.max_registered_size = max_registered_size
+        self.sqpoll = sqpoll
+        self.__init_rings()
+
+    def __init_rings(self):
+        self.__local = local()  # io_uring instance of each thread
+        self.__rings = list()  # io_uring instances of all threads to release them on close
+        self.__rings_lock = Lock()
+        self.__finalizer = weakref.finalize(self, _io_uring_queue_exit, self.__rings)
+
+    def __getstate__(self):
+        # io_uring instances cannot be shared with other processes and are created again as needed
+        state = self.__dict__.copy()
+        for attr in ('local', 'rings', 'rings_lock', 'finalizer'):
+            del state['_UringDirectoryStore__' + attr]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_rings()
+
+    def close(self):
+        """Release the io_uring instances and registered buffers used by the store"""
+        with self.__rings_lock:
+            _io_uring_queue_exit(self.__rings)
+        self.__local = local()
+
+    def __get_ring(self):
+        """Get the io_uring instance of the current thread or None if io_uring is not available"""
+        if not hasattr(self.__local, 'ring'):
+            self.__local.ring = None
+            try:
+                ring = self.__create_ring()
+            except (ImportError, OSError):  # liburing is not installed or io_uring is not supported
+                return None
+            self.__local.ring = ring
+            with self.__rings_lock:
+                self.__rings.append(ring)
+        return self.__local.ring
+
+    def __create_ring(self):
+        """Create an io_uring instance, polling the submission queue with a kernel thread if requested and supported"""
+        from liburing import IORING_FEAT_SQPOLL_NONFIXED, IORING_SETUP_SQPOLL, Ring, io_uring_queue_exit, \
+            io_uring_queue_init
+        if self.sqpoll:
+            ring = Ring()
+            try:
+                io_uring_queue_init(self.queue_depth, ring, IORING_SETUP_SQPOLL)
+            except OSError:  # e.g., polling requires privileges on older kernels
+                pass
+            else:
+                # Older kernels only poll requests for registered files, which the store does not use
+                if ring.features & IORING_FEAT_SQPOLL_NONFIXED:
+                    return ring
+                io_uring_queue_exit(ring)
+        ring = Ring()
+        io_uring_queue_init(self.queue_depth, ring)
+        return ring
+
+    def __get_registered_buffers(self, ring, size, count):
+        """
+        Get at least ``count`` buffers of ``size`` bytes registered with the io_uring instance of the current thread,
+        or as many as fit into ``max_registered_size``
+        """
+        count = min(count, self.max_registered_size // size) if size > 0 else 0
+        buffers = getattr(self.__local, 'buffers', list())
+        if count == 0 or getattr(self.__local, 'register_failed', False):
+            return list()
+        if buffers and len(buffers[0]) == size and len(buffers) >= count:
+            return buffers
+        from liburing import Iovec, io_uring_register_buffers, io_uring_unregister_buffers
+        if buffers:
+            io_uring_unregister_buffers(ring)
+        buffers = [bytearray(size) for _ in range(count)]
+        try:
+            io_uring_register_buffers(ring, Iovec(buffers))
+        except OSError:  # e.g., the buffers exceed the limit of locked memory of the process
+            self.__local.register_failed = True
+            buffers = list()
+        self.__local.buffers = buffers
+        return buffers
+
+    def __get_temp_path(self, key):
+        """Get the path of the temporary file for writing the value of the key, creating directories as needed"""
+        file_path = os.path.join(self.path, key)
+        # ensure there is no directory in the way
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+        # ensure containing directory exists
+        dir_path, file_name = os.path.split(file_path)
+        if os.path.isfile(dir_path):
+            raise KeyError(key)
+        if not os.path.exists(dir_path):
+            try:
+                os.makedirs(dir_path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise KeyError(key) from e
+        return file_path, os.path.join(dir_path, file_name + "." + uuid.uuid4().hex + ".partial")
+
+    def setitems(self, values):
+        """Write the given values, submitting the writes of up to ``queue_depth`` values at once via io_uring"""
+        ring = self.__get_ring()
+        if ring is None:
+            for key, value in values.items():
+                self[key] = value
+            return
+        items = [(self._normalize_key(key), ensure_contiguous_ndarray(value)) for key, value in values.items()]
+        for start in range(0, len(items), self.queue_depth):
+            self.__write_batch(ring, items[start:start + self.queue_depth])
+
+    def __write_batch(self, ring, items):
+        from liburing import Cqe, io_uring_cqe_seen, io_uring_get_sqe, io_uring_prep_write, \
+            io_uring_prep_write_fixed, io_uring_submit, io_uring_wait_cqe
+        sizes = {value.nbytes for _, value in items}
+        buffers = self.__get_registered_buffers(ring, sizes.pop(), len(items)) if len(sizes) == 1 else list()
+        paths = list()
+        fds = list()
+        written_values = list()  # hold on to the written values until the writes are complete
+        try:
+            for key, _ in items:
+                paths.append(self.__get_temp_path(key))
+                fds.append(os.open(paths[-1][1], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666))
+            # Only prepare the requests once all files are open, such that no requests are left in the queue on error
+            for index, (fd, (_, value)) in enumerate(zip(fds, items)):
+                sqe = io_uring_get_sqe(ring)
+                if index < len(buffers):
+                    np.copyto(np.frombuffer(buffers[index], dtype=np.uint8), value.view(np.uint8).reshape(-1))
+                    written_values.append(buffers[index])
+                    io_uring_prep_write_fixed(sqe, fd, buffers[index], index, 0)
+                else:
+                    written_values.append(ensure_bytes(value))
+                    io_uring_prep_write(sqe, fd, written_values[-1], 0)
+                sqe.user_data = index
+            io_uring_submit(ring)
+            cqe = Cqe()
+            error = None
+            for _ in range(len(items)):
+                io_uring_wait_cqe(ring, cqe)
+                index = cqe[0].user_data
+                try:
+                    written = cqe[0].res  # raises the error of the write if it failed
+                    value = memoryview(written_values[index])
+                    while written < len(value):  # complete short writes
+                        written += os.pwrite(fds[index], value[written:], written)
+                except OSError as e:
+                    error = error or e
+                finally:
+                    io_uring_cqe_seen(ring, cqe[0])
+            if error is not None:
+                raise error
+            for fd in fds:
+                os.close(fd)
+            fds.clear()
+            for file_path, temp_path in paths:
+                os.replace(temp_path, file_path)
+        finally:
+            for fd in fds:
+                os.close(fd)
+            for _, temp_path in paths:
+                # clean up if temp file still exists for whatever reason
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
@@ -1,14 +1,19 @@
 """Collection of utility I/O classes for the ZarrIO backend store."""
+import atexit
 import gc
 import traceback
 import multiprocessing
 import math
+import platform
 import json
 import logging
 from collections import deque
 from collections.abc import Iterable
+from contextlib import nullcontext
+from itertools import count
 from typing import Optional, Union, Literal, Tuple, Dict, Any
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from threadpoolctl import threadpool_limits
 from warnings import warn
 
@@ -32,6 +37,48 @@ from hdmf.spec import SpecWriter, SpecReader
 global _worker_context
 global _operation_to_run
 
+_process_pools = dict()
+"""
+Pools of worker processes reused across writes by ZarrIODataChunkIteratorQueue with reuse_pool=True,
+indexed by the number of jobs, the maximum number of threads per process, and the multiprocessing context
+"""
+
+_exhaust_ids = count()
+"""
+Counter identifying each parallel exhaustion of a queue, used to invalidate the datasets cached by the workers
+"""
+
+GIL_RELEASING_CODEC_IDS = ("blosc", "zstd", "lz4", "zlib", "gzip")
+"""
+Ids of the numcodecs compressors that release the GIL while encoding, such that chunks compressed
+with them can be written by multiple threads in parallel
+"""
+
+
+def shutdown_process_pools(wait: bool = True):
+    """
+    Shut down the pools of worker processes kept alive for writes with reuse_pool=True.
+
+    Subsequent writes with reuse_pool=True start a new pool. The pools are shut down automatically
+    when the interpreter exits.
+
+    :param wait: Wait for the pending writes to complete and the worker processes to exit
+    """
+    while len(_process_pools) > 0:
+        _, executor = _process_pools.popitem()
+        executor.shutdown(wait=wait)
+
+
+atexit.register(shutdown_process_pools)
+
+
+def _discard_process_pool(executor: ProcessPoolExecutor):
+    """Stop reusing the given pool of worker processes, e.g., because it is broken, and shut it down"""
+    for pool_key, pool in list(_process_pools.items()):
+        if pool is executor:
+            del _process_pools[pool_key]
+    executor.shutdown(wait=False)
+
 
 class ZarrIODataChunkIteratorQueue(deque):
     """
@@ -43,20 +90,35 @@ class ZarrIODataChunkIteratorQueue(deque):
     :param max_threads_per_process: Limits the number of threads used by each process. The default is None (no limits).
     :type max_threads_per_process: integer or None
     :param multiprocessing_context: Context for multiprocessing. It can be None (default), "fork" or "spawn".
-    Note that "fork" is only available on UNIX systems (not Windows).
+    Note that "fork" is only available on UNIX systems (not Windows). If None, then "fork" is used on Linux,
+    such that the workers inherit the modules imported by this process instead of importing them again,
+    and the default context of the platform is used otherwise.
     :type multiprocessing_context: string or None
+    :param reuse_pool: Keep the pool of worker processes alive after the queue is exhausted and reuse it
+    for subsequent writes with the same settings until :py:func:`shutdown_process_pools` is called.
+    The default is False.
+    :type reuse_pool: bool
+    :param use_threads: Write the datasets with a pool of threads instead of processes if encoding the chunks
+    of all datasets releases the GIL (see :py:data:`GIL_RELEASING_CODEC_IDS`). Threads avoid starting processes
+    and pickling the iterators, which are then not required to be pickleable, but their ``_get_data`` method
+    must be thread-safe. The default is False.
+    :type use_threads: bool
     """
     def __init__(
         self,
         number_of_jobs: int = 1,
         max_threads_per_process: Union[None, int] = None,
         multiprocessing_context: Union[None, Literal["fork", "spawn"]] = None,
+        reuse_pool: bool = False,
+        use_threads: bool = False,
     ):
         self.logger = logging.getLogger('%s.%s' % (self.__class__.__module__, self.__class__.__qualname__))
 
         self.number_of_jobs = number_of_jobs
         self.max_threads_per_process = max_threads_per_process
         self.multiprocessing_context = multiprocessing_context
+        self.reuse_pool = reuse_pool
+        self.use_threads = use_threads
 
         super().__init__()
 
@@ -127,14 +189,19 @@ class ZarrIODataChunkIteratorQueue(deque):
                 bar_format=bar_format,
                 unit="MB",
             )
+            exhaust_id = next(_exhaust_ids)
+            # Parallel write only works well with GenericDataChunkIterators
+            # Due to perfect alignment between chunks and buffers
+            use_threads = self.use_threads and all(
+                self._releases_gil(zarr_dataset) for (zarr_dataset, iterator) in iter(self)
+                if isinstance(iterator, GenericDataChunkIterator)
+            )
             for (zarr_dataset, iterator) in iter(self):
-                # Parallel write only works well with GenericDataChunkIterators
-                # Due to perfect alignment between chunks and buffers
                 if not isinstance(iterator, GenericDataChunkIterator):
                     continue
 
-                # Iterator must be pickleable as well, to be sent across jobs
-                is_iterator_pickleable, reason = self._is_pickleable(iterator=iterator)
+                # Iterator must be pickleable as well, to be sent across jobs (threads share the iterator instead)
+                is_iterator_pickleable, reason = (True, None) if use_threads else self._is_pickleable(iterator=iterator)
                 if not is_iterator_pickleable:
                     self.logger.debug(
                         f"Dataset {zarr_dataset.path} was not pickleable during parallel write.\n\nReason: {reason}"
@@ -155,7 +222,12 @@ class ZarrIODataChunkIteratorQueue(deque):
 
                 iterator_itemsize = iterator.dtype.itemsize
                 for buffer_selection in iterator.buffer_selection_generator:
-                    buffer_map_args = (zarr_dataset.store.path, zarr_dataset.path, iterator, buffer_selection)
+                    if use_threads:
+                        buffer_map_args = (zarr_dataset, iterator, buffer_selection)
+                    else:
+                        buffer_map_args = (
+                            zarr_dataset.store.path, zarr_dataset.path, iterator, buffer_selection, exhaust_id
+                        )
                     buffer_map.append(buffer_map_args)
                     buffer_size_in_MB = math.prod(
                         [slice_.stop - slice_.start for slice_ in buffer_selection]
@@ -170,46 +242,54 @@ class ZarrIODataChunkIteratorQueue(deque):
                 for (zarr_dataset, iterator) in parallelizable_iterators:
                     self.remove((zarr_dataset, iterator))
 
-                operation_to_run = self._write_buffer_zarr
-                process_initialization = dict
-                initialization_arguments = ()
-                with ProcessPoolExecutor(
-                    max_workers=self.number_of_jobs,
-                    initializer=self.initializer_wrapper,
-                    mp_context=multiprocessing.get_context(method=self.multiprocessing_context),
-                    initargs=(
-                        operation_to_run,
-                        process_initialization,
-                        initialization_arguments,
-                        self.max_threads_per_process
-                    ),
-                ) as executor:
-                    results = executor.map(self.function_wrapper, buffer_map)
-
-                    if display_progress:
-                        try:  # Import warnings are also issued at the level of the iterator instantiation
-                            from tqdm import tqdm
-
-                            results = tqdm(iterable=results, **progress_bar_options)
-
-                            # executor map must be iterated to deploy commands over jobs
-                            for size_in_MB, result in zip(size_in_MB_per_iteration, results):
-                                results.update(n=int(size_in_MB))  # int() to round down for better display
-                        except Exception as exception:  # pragma: no cover
-                            warn(
-                                message=(
-                                    "Unable to setup progress bar due to"
-                                    f"\n{type(exception)}: {str(exception)}\n\n{traceback.format_exc()}"
-                                ),
-                                stacklevel=2,
-                            )
+                if use_threads:
+                    executor = ThreadPoolExecutor(max_workers=self.number_of_jobs)
+                    operation_to_run = self._write_buffer_thread
+                    thread_limits = (
+                        nullcontext() if self.max_threads_per_process is None
+                        else threadpool_limits(limits=self.max_threads_per_process)
+                    )
+                else:
+                    executor = self._get_executor()
+                    operation_to_run = self.function_wrapper
+                    thread_limits = nullcontext()
+                # As for multiprocessing.Pool.map, send the buffers to the worker processes in about four batches
+                # per worker. Each batch is pickled at once, such that an iterator is pickled and reconstructed
+                # in the worker once per batch rather than once per buffer.
+                chunksize = max(1, math.ceil(len(buffer_map) / (4 * self.number_of_jobs)))
+                try:
+                    # A pool that is reused must not be shut down at the end of the write
+                    with nullcontext(executor) if self.reuse_pool and not use_threads else executor, thread_limits:
+                        results = executor.map(operation_to_run, buffer_map, chunksize=chunksize)
+
+                        if display_progress:
+                            try:  # Import warnings are also issued at the level of the iterator instantiation
+                                from tqdm import tqdm
+
+                                results = tqdm(iterable=results, **progress_bar_options)
+
+                                # executor map must be iterated to deploy commands over jobs
+                                for size_in_MB, result in zip(size_in_MB_per_iteration, results):
+                                    results.update(n=int(size_in_MB))  # int() to round down for better display
+                            except Exception as exception:  # pragma: no cover
+                                warn(
+                                    message=(
+                                        "Unable to setup progress bar due to"
+                                        f"\n{type(exception)}: {str(exception)}\n\n{traceback.format_exc()}"
+                                    ),
+                                    stacklevel=2,
+                                )
+                                # executor map must be iterated to deploy commands over jobs
+                                for result in results:
+                                    pass
+                        else:
                             # executor map must be iterated to deploy commands over jobs
                             for result in results:
                                 pass
-                    else:
-                        # executor map must be iterated to deploy commands over jobs
-                        for result in results:
-                            pass
+                except BrokenProcessPool:
+                    # A worker process terminated abruptly (e.g., was killed), such that the pool cannot be reused
+                    _discard_process_pool(executor)
+                    raise
 
         # Iterate through remaining queue and write DataChunks in a round-robin fashion until exhausted
         while len(self) > 0:
@@ -219,6 +299,36 @@ class ZarrIODataChunkIteratorQueue(deque):
 
         self.logger.debug(f"Exhausted DataChunkIterator from queue (length {len(self)})")
 
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Get the pool of worker processes used to write the buffers of the iterators in parallel.
+
+        If reuse_pool is True, then an existing pool created with the same settings is returned if available.
+        """
+        multiprocessing_context = self.multiprocessing_context
+        if multiprocessing_context is None and platform.system() == "Linux":
+            multiprocessing_context = "fork"
+        pool_key = (self.number_of_jobs, self.max_threads_per_process, multiprocessing_context)
+        executor = _process_pools.get(pool_key) if self.reuse_pool else None
+        if executor is None:
+            operation_to_run = self._write_buffer_zarr
+            process_initialization = dict
+            initialization_arguments = ()
+            executor = ProcessPoolExecutor(
+                max_workers=self.number_of_jobs,
+                initializer=self.initializer_wrapper,
+                mp_context=multiprocessing.get_context(method=multiprocessing_context),
+                initargs=(
+                    operation_to_run,
+                    process_initialization,
+                    initialization_arguments,
+                    self.max_threads_per_process
+                ),
+            )
+            if self.reuse_pool:
+                _process_pools[pool_key] = executor
+        return executor
+
     def append(self, dataset, data):
         """
         Append a value to the queue
@@ -257,6 +367,25 @@ class ZarrIODataChunkIteratorQueue(deque):
 
             return False, reason
 
+    @staticmethod
+    def _releases_gil(zarr_dataset: zarr.Array) -> bool:
+        """
+        Determine if encoding the chunks of the dataset releases the GIL, i.e., if the dataset can be
+        written efficiently by multiple threads in parallel.
+        """
+        compressor = zarr_dataset.compressor
+        return (
+            not zarr_dataset.filters
+            and zarr_dataset.dtype != object
+            and (compressor is None or compressor.codec_id in GIL_RELEASING_CODEC_IDS)
+        )
+
+    @staticmethod
+    def _write_buffer_thread(args: Tuple[zarr.Array, AbstractDataChunkIterator, Tuple[slice, ...]]):
+        """Write a buffer of the iterator to the dataset when writing in parallel with threads."""
+        zarr_dataset, iterator, buffer_selection = args
+        zarr_dataset[buffer_selection] = iterator._get_data(selection=buffer_selection)
+
     @staticmethod
     def initializer_wrapper(
         operation_to_run: callable,
@@ -288,10 +417,21 @@ class ZarrIODataChunkIteratorQueue(deque):
         relative_dataset_path: str,
         iterator: AbstractDataChunkIterator,
         buffer_selection: Tuple[slice, ...],
+        exhaust_id: int,
     ):
-        # TODO, figure out propagation of storage options
-        zarr_store = zarr.open(store=zarr_store_path, mode="r+")  # storage_options=storage_options)
-        zarr_dataset = zarr_store[relative_dataset_path]
+        # Keep the datasets opened by the worker for the following buffers instead of opening
+        # the Zarr file again for each buffer. The datasets may change between exhaustions of
+        # the queue (e.g., when the file is overwritten), so the cache only lives for one exhaustion.
+        if worker_context.get("exhaust_id") != exhaust_id:
+            worker_context["exhaust_id"] = exhaust_id
+            worker_context["datasets"] = dict()
+        dataset_key = (zarr_store_path, relative_dataset_path)
+        zarr_dataset = worker_context["datasets"].get(dataset_key)
+        if zarr_dataset is None:
+            # TODO, figure out propagation of storage options
+            zarr_store = zarr.open(store=zarr_store_path, mode="r+")  # storage_options=storage_options)
+            zarr_dataset = zarr_store[relative_dataset_path]
+            worker_context["datasets"][dataset_key] = zarr_dataset
 
         data = iterator._get_data(selection=buffer_selection)
         zarr_dataset[buffer_selection] = data
@@ -302,13 +442,13 @@ class ZarrIODataChunkIteratorQueue(deque):
         gc.collect()
 
     @staticmethod
-    def function_wrapper(args: Tuple[str, str, AbstractDataChunkIterator, Tuple[slice, ...]]):
+    def function_wrapper(args: Tuple[str, str, AbstractDataChunkIterator, Tuple[slice, ...], int]):
         """
         Needed as a part of a bug fix with cloud memory leaks discovered by SpikeInterface team.
 
         Recommended fix is to have a global wrapper for the executor.map level.
         """
-        zarr_store_path, relative_dataset_path, iterator, buffer_selection = args
+        zarr_store_path, relative_dataset_path, iterator, buffer_selection, exhaust_id = args
         global _worker_context
         global _operation_to_run
 
@@ -319,7 +459,8 @@ class ZarrIODataChunkIteratorQueue(deque):
                 zarr_store_path,
                 relative_dataset_path,
                 iterator,
-                buffer_selection
+                buffer_selection,
+                exhaust_id,
             )
         else:
             with threadpool_limits(limits=max_threads_per_process):
@@ -329,6 +470,7 @@ class ZarrIODataChunkIteratorQueue(deque):
                     relative_dataset_path,
                     iterator,
                     buffer_selection,
+                    exhaust_id,
                 )
 
 
@@ -8,6 +8,7 @@ import os
 import numpy as np
 import shutil
 import warnings
+from unittest.mock import patch
 
 # Try to import Zarr and disable tests if Zarr is not available
 import zarr
@@ -56,6 +57,24 @@ def total_size(source):
     return dsize
 
 
+class SetItemsDirectoryStore(zarr.storage.DirectoryStore):
+    """DirectoryStore with a setitems method that records which keys are written individually and in batches"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self.batches = list()  # keys written by each call of setitems
+        self.single_writes = list()  # keys written via __setitem__
+
+    def __setitem__(self, key, value):
+        self.single_writes.append(key)
+        super().__setitem__(key, value)
+
+    def setitems(self, values):
+        self.batches.append(set(values))
+        for key, value in values.items():
+            super().__setitem__(key, value)
+
+
 class BaseZarrWriterTestCase(TestCase, metaclass=ABCMeta):
     """
     Base class for unit tests for ZarrIO with support to configure the data store used.
@@ -252,6 +271,43 @@ class BaseTestZarrWriter(BaseZarrWriterTestCase):
         writer.close()
         assert ZarrIO.can_read(self.store)
 
+    def test_write_group_batched_metadata(self):
+        """Test that the metadata of a group and its children is written with a single batch"""
+        data = np.arange(100, 200, 10).reshape(2, 5)
+        self.__dataset_builder = DatasetBuilder('my_data', data, attributes={'attr2': 17})
+        self.createGroupBuilder()
+        store = SetItemsDirectoryStore(self.store_path)
+        with ZarrIO(store, manager=self.manager, mode='w') as writer:
+            writer.write_builder(self.builder)
+        # The chunks of the dataset are written via setitems as well
+        metadata_batches = [keys for keys in store.batches if any(key.endswith('.zgroup') for key in keys)]
+        self.assertEqual(len(metadata_batches), 1)
+        self.assertSetEqual(metadata_batches[0],
+                            {'test_bucket/.zgroup',
+                             'test_bucket/foo_holder/.zgroup',
+                             'test_bucket/foo_holder/foo1/.zgroup',
+                             'test_bucket/foo_holder/foo1/.zattrs',
+                             'test_bucket/foo_holder/foo1/my_data/.zarray',
+                             'test_bucket/foo_holder/foo1/my_data/.zattrs'})
+        # None of the metadata of the group is written on its own
+        self.assertFalse(any(key.startswith('test_bucket/') for key in store.single_writes))
+        with ZarrIO(store, manager=self.manager, mode='r') as reader:
+            dataset = reader.read_builder()['test_bucket/foo_holder/foo1/my_data']
+            self.assertListEqual(dataset['data'][:].tolist(), data.tolist())
+            self.assertEqual(dataset.attributes['attr2'], 17)
+
+    def test_write_group_batched_metadata_exhaust_dci_false(self):
+        """Test that arrays resized when exhausting the queue at the end of the write update their metadata"""
+        # The iterator does not know the size of the data such that the array is resized with every buffer
+        data = DataChunkIterator(data=iter(np.arange(10)), buffer_size=3)
+        foofile = FooFile(buckets=[FooBucket('test_bucket', [Foo('foo1', data, "I am foo1", 17, 3.14)])])
+        with ZarrIO(self.store, manager=self.manager, mode='w') as writer:
+            writer.write(foofile, exhaust_dci=False)
+        with ZarrIO(self.store, manager=self.manager, mode='r') as reader:
+            read_foofile = reader.read()
+            self.assertListEqual(read_foofile.buckets['test_bucket'].foos['foo1'].my_data[:].tolist(),
+                                 list(range(10)))
+
     def test_write_compound(self, test_data=None):
         """
         :param test_data: Optional list of the form [(1, 'STR1'), (2, 'STR2')], i.e., a list of tuples where
@@ -629,6 +685,21 @@ class BaseTestZarrWriteUnit(BaseZarrWriterTestCase):
         self.__write_attribute_test_helper('attr', tuple(['a', 'b', 'c', 'd']))
         self.__write_attribute_test_helper('attr', tuple(['e', 'f', 'g']))
 
+    def test_write_attributes_single_update(self):
+        """Test that all attributes of an object are written with a single write of the attributes"""
+        tempIO = ZarrIO(self.store, mode='w')
+        tempIO.open()
+        testgroup = tempIO.file
+        attr = {'intattr': np.int32(5), 'strattr': 'a', 'listattr': [b'a', b'b']}
+        with patch.object(zarr.attrs.Attributes, '_put_nosync', autospec=True,
+                          side_effect=zarr.attrs.Attributes._put_nosync) as put:
+            tempIO.write_attributes(testgroup, attr)
+        self.assertEqual(put.call_count, 1)
+        self.assertEqual(testgroup.attrs['intattr'], 5)
+        self.assertEqual(testgroup.attrs['strattr'], 'a')
+        self.assertTupleEqual(tuple(testgroup.attrs['listattr']), ('a', 'b'))
+        tempIO.close()
+
     def test_write_attribute_write_unsupported_list_of_types(self):
         """Test that writing a list of types fails"""
         with self.assertRaises(TypeError):
@@ -6,6 +6,15 @@ import zarr
 
 HAVE_FSSPEC = check_s3fs_ffspec_installed()
 
+try:
+    import pyarrow.fs  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# Read S3 files via pyarrow if available. Set to "fsspec" to test streaming via s3fs instead.
+REMOTE_STORE = "pyarrow" if HAVE_PYARROW else "fsspec"
+
 
 class TestFSSpecStreaming(unittest.TestCase):
     @unittest.skipIf(not HAVE_FSSPEC, "fsspec not installed")
@@ -18,7 +27,7 @@ class TestFSSpecStreaming(unittest.TestCase):
             "ecephys_625749_2022-08-03_15-15-06_experiment1_recording1.nwb.zarr/"
         )
 
-        with NWBZarrIO(remote_path, mode="r", storage_options=dict(anon=True)) as io:
+        with NWBZarrIO(remote_path, mode="r", storage_options=dict(anon=True), remote_store=REMOTE_STORE) as io:
             nwbfile = io.read()
 
         self.assertEqual(nwbfile.identifier, "ecephys_625749_2022-08-03_15-15-06")
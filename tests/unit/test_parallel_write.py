@@ -1,14 +1,21 @@
 """Module for testing the parallel write feature for the ZarrIO."""
+import os
+import pickle
 import unittest
 import platform
 from typing import Tuple, Dict
 from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
 from unittest.mock import patch
 
 import numpy as np
+from numcodecs import Delta
 from numpy.testing import assert_array_equal
 from hdmf_zarr import ZarrIO
-from hdmf.common import DynamicTable, VectorData, get_manager
+from hdmf_zarr.utils import ZarrDataIO, ZarrIODataChunkIteratorQueue, shutdown_process_pools
+from hdmf.common import DynamicTable, SimpleMultiContainer, VectorData, get_manager
 from hdmf.data_utils import GenericDataChunkIterator, DataChunkIterator
 
 try:
@@ -19,10 +26,18 @@ except ImportError:
 
 
 class PickleableDataChunkIterator(GenericDataChunkIterator):
-    """Generic data chunk iterator used for specific testing purposes."""
+    """
+    Generic data chunk iterator used for specific testing purposes.
+
+    The iterator is pickled for every buffer sent to the worker processes. Rather than pickling the data
+    each time, the data are copied once into shared memory and the workers only receive its name, shape,
+    and dtype. Call close_shared_memory after the write has completed to release the shared memory.
+    """
 
     def __init__(self, data, **base_kwargs):
         self.data = data
+        self._shared_memory = None  # shared memory created by this process to share the data with the workers
+        self._attached_shared_memory = None  # shared memory backing the data in a worker process
 
         self._base_kwargs = base_kwargs
         super().__init__(**base_kwargs)
@@ -34,6 +49,7 @@ class PickleableDataChunkIterator(GenericDataChunkIterator):
         return self.data.shape
 
     def _get_data(self, selection: Tuple[slice]) -> np.ndarray:
+        # Indexing with a tuple of slices returns a view of the in-memory array, i.e., no data is copied
         return self.data[selection]
 
     def __reduce__(self):
@@ -45,18 +61,33 @@ class PickleableDataChunkIterator(GenericDataChunkIterator):
         dictionary = dict()
         # Note this is not a recommended way to pickle contents
         # ~~ Used for testing purposes only ~~
-        dictionary["data"] = self.data
+        if self._attached_shared_memory is None and self._shared_memory is None:
+            self._shared_memory = SharedMemory(create=True, size=max(self.data.nbytes, 1))
+            np.ndarray(self.data.shape, dtype=self.data.dtype, buffer=self._shared_memory.buf)[...] = self.data
+        shared_memory = self._attached_shared_memory or self._shared_memory
+        dictionary["shared_memory_name"] = shared_memory.name
+        dictionary["shape"] = self.data.shape
+        dictionary["dtype"] = self.data.dtype.str
         dictionary["base_kwargs"] = self._base_kwargs
 
         return dictionary
 
     @staticmethod
     def _from_dict(dictionary: dict) -> GenericDataChunkIterator:  # TODO: need to investigate the need of base path
-        data = dictionary["data"]
+        shared_memory = SharedMemory(name=dictionary["shared_memory_name"])
+        data = np.ndarray(dictionary["shape"], dtype=dictionary["dtype"], buffer=shared_memory.buf)
 
         iterator = PickleableDataChunkIterator(data=data, **dictionary["base_kwargs"])
+        iterator._attached_shared_memory = shared_memory
         return iterator
 
+    def close_shared_memory(self):
+        """Release the shared memory used to share the data with the worker processes."""
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
 
 class NotPickleableDataChunkIterator(GenericDataChunkIterator):
     """Generic data chunk iterator used for specific testing purposes."""
@@ -74,9 +105,37 @@ class NotPickleableDataChunkIterator(GenericDataChunkIterator):
         return self.data.shape
 
     def _get_data(self, selection: Tuple[slice]) -> np.ndarray:
+        # Indexing with a tuple of slices returns a view of the in-memory array, i.e., no data is copied
         return self.data[selection]
 
 
+def test_iterator_get_data_returns_view():
+    data = np.arange(12.).reshape(4, 3)
+    for iterator_class in (PickleableDataChunkIterator, NotPickleableDataChunkIterator):
+        iterator = iterator_class(data=data, buffer_shape=(2, 3), chunk_shape=(2, 3))
+        data_chunk = next(iterator)
+        assert np.shares_memory(data_chunk.data, data)
+        assert_array_equal(data_chunk.data, data[data_chunk.selection])
+
+
+def test_pickleable_iterator_shared_memory():
+    data = np.arange(12.).reshape(4, 3)
+    iterator = PickleableDataChunkIterator(data=data, buffer_shape=(2, 3), chunk_shape=(2, 3))
+    iterator_copy = pickle.loads(pickle.dumps(iterator))
+    try:
+        assert_array_equal(iterator_copy.data, data)
+        # The copy is backed by the shared memory rather than by a pickled copy of the data
+        shared_data = np.ndarray(data.shape, dtype=data.dtype, buffer=iterator._shared_memory.buf)
+        shared_data[0, 0] = -1.
+        del shared_data
+        assert iterator_copy.data[0, 0] == -1.
+        # The shared memory is only created once
+        assert pickle.loads(pickle.dumps(iterator))._to_dict()["shared_memory_name"] == iterator._shared_memory.name
+    finally:
+        del iterator_copy
+        iterator.close_shared_memory()
+
+
 def test_parallel_write(tmpdir):
     number_of_jobs = 2
     data = np.array([1., 2., 3.])
@@ -86,6 +145,7 @@ def test_parallel_write(tmpdir):
     zarr_top_level_path = str(tmpdir / "test_parallel_write.zarr")
     with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
         io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    column.data.close_shared_memory()
 
     with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
         dynamic_table_roundtrip = io.read()
@@ -93,6 +153,125 @@ def test_parallel_write(tmpdir):
         assert_array_equal(data_roundtrip, data)
 
 
+def test_parallel_write_flushes_batched_metadata(tmpdir):
+    """Test that the metadata of datasets in groups are on disk when the worker processes open the datasets"""
+    number_of_jobs = 2
+    data = np.arange(10.)
+    column = VectorData(name="TestColumn", description="", data=PickleableDataChunkIterator(data=data))
+    dynamic_table = DynamicTable(name="TestTable", description="", id=list(range(len(data))), columns=[column])
+    # The metadata of the table (i.e., of a group within the file) are written in a batch
+    container = SimpleMultiContainer(name="root", containers=[dynamic_table])
+
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_flushes_batched_metadata.zarr")
+    metadata_on_disk = list()
+    exhaust_queue = ZarrIODataChunkIteratorQueue.exhaust_queue
+
+    def check_metadata_and_exhaust_queue(queue, *args, **kwargs):
+        for dataset, _ in queue:
+            metadata_on_disk.append(os.path.exists(os.path.join(zarr_top_level_path, dataset.path, ".zarray")))
+        return exhaust_queue(queue, *args, **kwargs)
+
+    try:
+        with patch.object(ZarrIODataChunkIteratorQueue, "exhaust_queue", check_metadata_and_exhaust_queue):
+            with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="w") as io:
+                io.write(container=container, number_of_jobs=number_of_jobs)
+    finally:
+        column.data.close_shared_memory()
+    assert metadata_on_disk == [True]
+
+    with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
+        container_roundtrip = io.read()
+        assert_array_equal(container_roundtrip["TestTable"]["TestColumn"].data, data)
+
+
+def test_parallel_write_batches_buffers(tmpdir):
+    number_of_jobs = 2
+    data = np.arange(16.)
+    iterator = PickleableDataChunkIterator(data=data, buffer_shape=(1,), chunk_shape=(1,))
+    column = VectorData(name="TestColumn", description="", data=iterator)
+    dynamic_table = DynamicTable(name="TestTable", description="", id=list(range(len(data))), columns=[column])
+
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_batches_buffers.zarr")
+    with patch.object(
+        PickleableDataChunkIterator, "_to_dict", autospec=True, side_effect=PickleableDataChunkIterator._to_dict
+    ) as to_dict:
+        with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
+            io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    column.data.close_shared_memory()
+
+    # The 16 buffers are sent in 8 batches of 2 buffers, in addition to checking that the iterator can be pickled
+    assert to_dict.call_count == 1 + 8
+    with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
+        dynamic_table_roundtrip = io.read()
+        assert_array_equal(dynamic_table_roundtrip["TestColumn"].data, data)
+
+
+def test_parallel_write_reuse_pool(tmpdir):
+    number_of_jobs = 2
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_reuse_pool.zarr")
+    # A queue with the same settings as the writes below gets the pool used by the writes
+    queue = ZarrIODataChunkIteratorQueue(number_of_jobs=number_of_jobs, reuse_pool=True)
+    executors = list()
+    try:
+        # Overwrite the same file with data of a different shape to check that the workers do not reuse stale datasets
+        for data in (np.array([1., 2., 3.]), np.arange(10.)):
+            # Write one element per buffer such that every worker writes to the dataset
+            iterator = PickleableDataChunkIterator(data=data, buffer_shape=(1,), chunk_shape=(1,))
+            column = VectorData(name="TestColumn", description="", data=iterator)
+            dynamic_table = DynamicTable(
+                name="TestTable", description="", id=list(range(len(data))), columns=[column]
+            )
+            with patch("hdmf_zarr.utils.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool_class:
+                with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
+                    io.write(container=dynamic_table, number_of_jobs=number_of_jobs, reuse_pool=True)
+                executors.append(queue._get_executor())
+            # Only the first write starts a pool, which is the one the queue gets
+            assert pool_class.call_count == (1 if len(executors) == 1 else 0)
+            column.data.close_shared_memory()
+
+            with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
+                dynamic_table_roundtrip = io.read()
+                assert_array_equal(dynamic_table_roundtrip["TestColumn"].data, data)
+        assert executors[0] is executors[1]
+        # After shutting down the pools, writes with reuse_pool=True start a new pool
+        shutdown_process_pools()
+        assert queue._get_executor() is not executors[0]
+    finally:
+        shutdown_process_pools()
+
+
+def _terminate_worker(*args):
+    """Write operation that terminates the worker process abruptly, which breaks the pool"""
+    os._exit(1)
+
+
+@unittest.skipIf(platform.system() != "Linux", "patching the write operation of the workers requires fork")
+def test_parallel_write_reuse_pool_broken(tmpdir):
+    number_of_jobs = 2
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_reuse_pool_broken.zarr")
+    data = np.arange(10.)
+    iterator = PickleableDataChunkIterator(data=data, buffer_shape=(1,), chunk_shape=(1,))
+    column = VectorData(name="TestColumn", description="", data=iterator)
+    dynamic_table = DynamicTable(name="TestTable", description="", id=list(range(len(data))), columns=[column])
+    try:
+        queue = ZarrIODataChunkIteratorQueue(number_of_jobs=number_of_jobs, reuse_pool=True)
+        with patch.object(ZarrIODataChunkIteratorQueue, "_write_buffer_zarr", staticmethod(_terminate_worker)):
+            # The pool created here is reused by the write below
+            broken_executor = queue._get_executor()
+            with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="w") as io:
+                try:
+                    io.write(container=dynamic_table, number_of_jobs=number_of_jobs, reuse_pool=True)
+                except BrokenProcessPool:
+                    pass
+                else:
+                    raise AssertionError("BrokenProcessPool not raised")
+        # The broken pool is not reused by subsequent writes
+        assert queue._get_executor() is not broken_executor
+    finally:
+        column.data.close_shared_memory()
+        shutdown_process_pools()
+
+
 def test_mixed_iterator_types(tmpdir):
     number_of_jobs = 2
 
@@ -122,6 +301,7 @@ def test_mixed_iterator_types(tmpdir):
     zarr_top_level_path = str(tmpdir / "test_mixed_iterator_types.zarr")
     with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
         io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    generic_iterator_column.data.close_shared_memory()
 
     with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
         dynamic_table_roundtrip = io.read()
@@ -162,6 +342,51 @@ def test_mixed_iterator_pickleability(tmpdir):
     zarr_top_level_path = str(tmpdir / "test_mixed_iterator_pickleability.zarr")
     with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
         io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    pickleable_iterator_column.data.close_shared_memory()
+
+    with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
+        dynamic_table_roundtrip = io.read()
+
+        pickleable_iterator_data_roundtrip = dynamic_table_roundtrip["TestGenericIteratorColumn"].data
+        assert_array_equal(pickleable_iterator_data_roundtrip, pickleable_iterator_data)
+
+        not_pickleable_iterator_data_roundtrip = dynamic_table_roundtrip["TestClassicIteratorColumn"].data
+        assert_array_equal(not_pickleable_iterator_data_roundtrip, not_pickleable_iterator_data)
+
+
+def test_parallel_write_threads(tmpdir):
+    number_of_jobs = 2
+
+    pickleable_iterator_data = np.array([1., 2., 3.])
+    pickleable_iterator_column = VectorData(
+        name="TestGenericIteratorColumn",
+        description="",
+        data=PickleableDataChunkIterator(data=pickleable_iterator_data, buffer_shape=(1,), chunk_shape=(1,))
+    )
+
+    not_pickleable_iterator_data = np.array([4., 5., 6.])
+    not_pickleable_iterator_column = VectorData(
+        name="TestClassicIteratorColumn",
+        description="",
+        data=NotPickleableDataChunkIterator(data=not_pickleable_iterator_data, buffer_shape=(1,), chunk_shape=(1,))
+    )
+
+    dynamic_table = DynamicTable(
+        name="TestTable",
+        description="",
+        id=list(range(3)),
+        columns=[pickleable_iterator_column, not_pickleable_iterator_column],
+    )
+
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_threads.zarr")
+    write_buffer_thread = ZarrIODataChunkIteratorQueue._write_buffer_thread
+    with patch.object(
+        ZarrIODataChunkIteratorQueue, "_write_buffer_thread", side_effect=write_buffer_thread
+    ) as mock_write_buffer_thread:
+        with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
+            io.write(container=dynamic_table, number_of_jobs=number_of_jobs, use_threads=True)
+    # All buffers of both iterators are written by threads, i.e., the iterators need not be pickleable
+    assert mock_write_buffer_thread.call_count == 6
 
     with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
         dynamic_table_roundtrip = io.read()
@@ -173,6 +398,29 @@ def test_mixed_iterator_pickleability(tmpdir):
         assert_array_equal(not_pickleable_iterator_data_roundtrip, not_pickleable_iterator_data)
 
 
+def test_parallel_write_threads_filters(tmpdir):
+    """Test that datasets with filters, which may hold the GIL while encoding, are written with processes"""
+    number_of_jobs = 2
+    data = np.array([1., 2., 3.])
+    column = VectorData(
+        name="TestColumn",
+        description="",
+        data=ZarrDataIO(data=PickleableDataChunkIterator(data=data), filters=[Delta(dtype="<f8")])
+    )
+    dynamic_table = DynamicTable(name="TestTable", description="", id=list(range(3)), columns=[column])
+
+    zarr_top_level_path = str(tmpdir / "test_parallel_write_threads_filters.zarr")
+    with patch.object(ZarrIODataChunkIteratorQueue, "_write_buffer_thread") as mock_write_buffer_thread:
+        with ZarrIO(path=zarr_top_level_path,  manager=get_manager(), mode="w") as io:
+            io.write(container=dynamic_table, number_of_jobs=number_of_jobs, use_threads=True)
+    column.data.data.close_shared_memory()
+    mock_write_buffer_thread.assert_not_called()
+
+    with ZarrIO(path=zarr_top_level_path, manager=get_manager(), mode="r") as io:
+        dynamic_table_roundtrip = io.read()
+        assert_array_equal(dynamic_table_roundtrip["TestColumn"].data, data)
+
+
 @unittest.skipIf(not TQDM_INSTALLED, "optional tqdm module is not installed")
 def test_simple_tqdm(tmpdir):
     number_of_jobs = 2
@@ -196,6 +444,7 @@ def test_simple_tqdm(tmpdir):
                 id=list(range(3))  # must provide id's when all columns are iterators
             )
             io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    column.data.close_shared_memory()
 
     assert expected_desc in tqdm_out.getvalue()
 
@@ -233,6 +482,7 @@ def test_compound_tqdm(tmpdir):
                 id=list(range(3))  # must provide id's when all columns are iterators
             )
             io.write(container=dynamic_table, number_of_jobs=number_of_jobs)
+    pickleable_column.data.close_shared_memory()
 
     tqdm_out_value = tqdm_out.getvalue()
     assert expected_desc_pickleable in tqdm_out_value
@@ -0,0 +1,694 @@
+"""Module for testing the Zarr storage classes used by ZarrIO to access remote files."""
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import zarr
+from numpy.testing import assert_array_equal
+
+from hdmf.testing import TestCase
+from hdmf_zarr.backend import ZarrIO
+from hdmf_zarr.storage import (ConcurrentFSStore, ArrowFSStore, BatchedMetadataStore, DirectDirectoryStore,
+                               PreloadedMetadataStore, UringDirectoryStore, _ReadCache)
+
+try:
+    import fsspec
+    from fsspec.asyn import AsyncFileSystem
+    HAVE_FSSPEC = True
+except ImportError:
+    HAVE_FSSPEC = False
+
+try:
+    import s3fs
+    HAVE_S3FS = True
+except ImportError:
+    HAVE_S3FS = False
+
+try:
+    from pyarrow.fs import LocalFileSystem
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+try:
+    import liburing
+    _ring = liburing.Ring()
+    liburing.io_uring_queue_init(1, _ring)
+    liburing.io_uring_queue_exit(_ring)
+    HAVE_IO_URING = True
+except (ImportError, OSError):
+    HAVE_IO_URING = False
+
+
+if HAVE_FSSPEC:
+    class LatencyFileSystem(AsyncFileSystem):
+        """In-memory asynchronous filesystem that delays every read, e.g., to emulate the latency of S3"""
+
+        protocol = "latency"
+        cachable = False
+        latency = 0.05
+        files = dict()
+
+        async def _cat_file(self, path, start=None, end=None, **kwargs):
+            await asyncio.sleep(self.latency)
+            path = self._strip_protocol(path)
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            return self.files[path][start:end]
+
+        async def _info(self, path, **kwargs):
+            path = self._strip_protocol(path)
+            if path in self.files:
+                return {"name": path, "size": len(self.files[path]), "type": "file"}
+            if any(key.startswith(path + "/") for key in self.files):
+                return {"name": path, "size": 0, "type": "directory"}
+            raise FileNotFoundError(path)
+
+
+class TestReadCache(TestCase):
+    """Test the least-recently-used cache used by the read-only remote stores"""
+
+    def test_evict_least_recently_used(self):
+        cache = _ReadCache(max_size=8)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        self.assertEqual(cache.get("a"), b"aaaa")  # makes "b" the least recently used value
+        cache.put("c", b"cc")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_skip_values_larger_than_cache(self):
+        cache = _ReadCache(max_size=2)
+        cache.put("a", b"aaaa")
+        self.assertNotIn("a", cache)
+
+    def test_getitems(self):
+        cache = _ReadCache(max_size=100)
+        cache.put("a", b"a")
+        read_keys = []
+
+        def read(keys):
+            read_keys.extend(keys)
+            return {key: key.encode() for key in keys if key != "missing"}
+
+        self.assertDictEqual(cache.getitems(["a", "b", "missing"], read), {"a": b"a", "b": b"b"})
+        self.assertListEqual(read_keys, ["b", "missing"])
+        self.assertIn("b", cache)
+
+    def test_pickle(self):
+        cache = _ReadCache(max_size=100, prefetch=True)
+        cache.put("a", b"a")
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(cache.max_size, 100)
+        self.assertTrue(cache.prefetch)
+        self.assertNotIn("a", cache)
+
+
+class TestReadCachePrefetch(TestCase):
+    """Test prefetching of the next chunk when reading the chunks of an array sequentially"""
+
+    def setUp(self):
+        self.cache = _ReadCache(max_size=1000, prefetch=True)
+        self.cache.put("arr/.zarray", json.dumps({"shape": [10], "chunks": [2]}).encode())
+        meta_2d = {"shape": [4, 3], "chunks": [2, 2], "dimension_separator": "/"}
+        self.cache.put("arr2d/.zarray", json.dumps(meta_2d).encode())
+        self.read_keys = []
+
+    def read(self, keys):
+        self.read_keys.extend(keys)
+        return {key: key.encode() for key in keys}
+
+    def test_prefetch_sequential(self):
+        self.assertDictEqual(self.cache.getitems(["arr/0"], self.read), {"arr/0": b"arr/0"})
+        self.assertDictEqual(self.cache.getitems(["arr/1"], self.read), {"arr/1": b"arr/1"})
+        self.assertDictEqual(self.cache.getitems(["arr/2", "arr/3"], self.read), {"arr/2": b"arr/2", "arr/3": b"arr/3"})
+        self.cache.getitems(["arr/4"], self.read)  # wait for the prefetch of arr/4 to complete
+        # arr/1 and arr/2 were prefetched, such that each chunk was read exactly once
+        self.assertListEqual(sorted(self.read_keys), ["arr/0", "arr/1", "arr/2", "arr/3", "arr/4"])
+
+    def test_no_prefetch_random_access(self):
+        self.cache.getitems(["arr/3"], self.read)
+        self.cache.getitems(["arr/1"], self.read)
+        self.assertListEqual(self.read_keys, ["arr/3", "arr/1"])
+
+    def test_no_prefetch_after_last_chunk(self):
+        self.cache.getitems(["arr/%d" % i for i in range(5)], self.read)
+        self.assertListEqual(self.read_keys, ["arr/%d" % i for i in range(5)])
+
+    def test_no_prefetch_metadata(self):
+        self.cache.getitems(["arr/.zattrs"], self.read)
+        self.cache.getitem(".zgroup", lambda key: self.read([key])[key])
+        self.assertListEqual(self.read_keys, ["arr/.zattrs", ".zgroup"])
+
+    def test_prefetch_next_row(self):
+        self.cache.getitems(["arr2d/0/0", "arr2d/0/1"], self.read)
+        self.cache.getitems(["arr2d/1/0"], self.read)
+        self.assertListEqual(sorted(self.read_keys), ["arr2d/0/0", "arr2d/0/1", "arr2d/1/0"])
+
+    def test_prefetch_missing_chunk(self):
+        def read(keys):
+            self.read_keys.extend(keys)
+            return {key: key.encode() for key in keys if key != "arr/1"}
+
+        self.cache.getitems(["arr/0"], read)
+        self.assertDictEqual(self.cache.getitems(["arr/1"], read), {})
+        self.assertEqual(self.read_keys.count("arr/1"), 2)
+
+
+@unittest.skipIf(not HAVE_FSSPEC, "fsspec not installed")
+class TestConcurrentFSStore(TestCase):
+    """Test reading chunks concurrently from an fsspec filesystem"""
+
+    def setUp(self):
+        self.url = "memory://test_concurrent_fsstore.zarr"
+        self.data = np.arange(100).reshape(10, 10)
+        zarr.array(self.data, chunks=(2, 2), store=zarr.storage.FSStore(self.url))
+
+    def tearDown(self):
+        fs = fsspec.filesystem("memory")
+        if fs.exists("/test_concurrent_fsstore.zarr"):
+            fs.rm("/test_concurrent_fsstore.zarr", recursive=True)
+
+    def test_max_concurrent_reads_invalid(self):
+        with self.assertRaisesWith(ValueError, "max_concurrent_reads must be a positive integer"):
+            ConcurrentFSStore(self.url, max_concurrent_reads=0)
+
+    @unittest.skipIf(not HAVE_S3FS, "s3fs not installed")
+    def test_s3_max_pool_connections(self):
+        """Test that the connection pool of s3fs is large enough for the concurrent reads"""
+        # Older versions of FSStore check whether the path exists, which must not contact S3 in unit tests
+        with patch.object(s3fs.S3FileSystem, "exists", return_value=False):
+            store = ConcurrentFSStore("s3://bucket/file.zarr", mode="r", anon=True, max_concurrent_reads=32)
+            self.assertEqual(store.fs.config_kwargs["max_pool_connections"], 32)
+            store = ConcurrentFSStore("s3://bucket/file.zarr", mode="r", anon=True, max_concurrent_reads=4)
+            self.assertNotIn("max_pool_connections", store.fs.config_kwargs)
+            store = ConcurrentFSStore("s3://bucket/file.zarr", mode="r", anon=True)
+            self.assertNotIn("max_pool_connections", store.fs.config_kwargs)
+            store = ConcurrentFSStore("s3://bucket/file.zarr", mode="r", anon=True, max_concurrent_reads=32,
+                                      config_kwargs={"max_pool_connections": 64})
+            self.assertEqual(store.fs.config_kwargs["max_pool_connections"], 64)
+
+    @unittest.skipIf(not HAVE_S3FS, "s3fs not installed")
+    def test_s3_shared_filesystem(self):
+        """Test that stores with the same storage options share the filesystem and thus its connections"""
+        with patch.object(s3fs.S3FileSystem, "exists", return_value=False):
+            store1 = ConcurrentFSStore("s3://bucket/file1.zarr", mode="r", anon=True)
+            store2 = ConcurrentFSStore("s3://bucket/file2.zarr", mode="r", anon=True)
+            store3 = ConcurrentFSStore("s3://bucket/file2.zarr", mode="r", anon=False)
+        self.assertIs(store1.fs, store2.fs)
+        self.assertIsNot(store2.fs, store3.fs)
+
+    def test_getitems(self):
+        store = ConcurrentFSStore(self.url, mode="r", max_concurrent_reads=4)
+        values = store.getitems(["0.0", "4.4", "9.9"], contexts={})
+        # the missing chunk "9.9" is omitted from the result
+        self.assertListEqual(sorted(values.keys()), ["0.0", "4.4"])
+        self.assertEqual(values["0.0"], zarr.storage.FSStore(self.url)["0.0"])
+
+    def test_getitems_reuse_executor(self):
+        """Test that the thread pool for concurrent reads from synchronous filesystems is created once per store"""
+        store = ConcurrentFSStore(self.url, mode="r", max_concurrent_reads=4)
+        with patch("hdmf_zarr.storage.ThreadPoolExecutor", wraps=ThreadPoolExecutor) as executor_class:
+            store.getitems(["0.0", "0.1"], contexts={})
+            store.getitems(["1.0", "1.1"], contexts={})
+        executor_class.assert_called_once_with(max_workers=4)
+
+    def test_pickle(self):
+        store = ConcurrentFSStore(self.url, mode="r")
+        store.getitems(["0.0"], contexts={})
+        store = pickle.loads(pickle.dumps(store))
+        self.assertListEqual(sorted(store.getitems(["0.0", "9.9"], contexts={})), ["0.0"])
+
+    def test_read_array(self):
+        store = ConcurrentFSStore(self.url, mode="r", max_concurrent_reads=4)
+        assert_array_equal(zarr.open_array(store=store, mode="r")[:], self.data)
+
+    def test_cache_read_only(self):
+        store = ConcurrentFSStore(self.url, mode="r")
+        self.assertEqual(len(store.getitems(["0.0", "0.1"])), 2)
+        value = store[".zarray"]
+        # values are served from the cache after they have been read
+        fsspec.filesystem("memory").rm("/test_concurrent_fsstore.zarr", recursive=True)
+        self.assertEqual(store[".zarray"], value)
+        self.assertIn(".zarray", store)
+        self.assertEqual(len(store.getitems(["0.0", "0.1", "0.2"])), 2)
+
+    def test_no_cache_writeable(self):
+        store = ConcurrentFSStore(self.url, mode="w")
+        store["key"] = b"value"
+        store["key"] = b"new value"
+        self.assertEqual(store["key"], b"new value")
+        fsspec.filesystem("memory").rm("/test_concurrent_fsstore.zarr/key")
+        self.assertNotIn("key", store)
+
+    def test_zarrio_remote_store(self):
+        """Test that ZarrIO opens remote files with a ConcurrentFSStore"""
+        zarr.consolidate_metadata(self.url)
+        with ZarrIO(self.url, mode="r", max_concurrent_reads=4) as read_io:
+            read_io.open()
+            self.assertIsInstance(read_io.file.store, zarr.storage.ConsolidatedMetadataStore)
+            self.assertIsInstance(read_io.file.store.store, ConcurrentFSStore)
+            self.assertEqual(read_io.file.store.store.max_concurrent_reads, 4)
+        with ZarrIO(self.url, mode="r-", preload_metadata=True) as read_io:
+            read_io.open()
+            self.assertIsInstance(read_io.file.store, ConcurrentFSStore)
+            self.assertIsNone(read_io.file.store.max_concurrent_reads)
+
+    def test_zarrio_preload_metadata_default(self):
+        """Test that ZarrIO does not list remote files to preload their metadata by default"""
+        with patch.object(ConcurrentFSStore, "keys") as mock_keys:
+            with ZarrIO(self.url, mode="r") as read_io:
+                read_io.open()
+                self.assertIsInstance(read_io.file.store, ConcurrentFSStore)
+                assert_array_equal(read_io.file[:], self.data)
+        mock_keys.assert_not_called()
+
+    def test_zarrio_preload_metadata_listing_empty(self):
+        """Test that files are opened without preloading if the server does not support listing"""
+        with patch.object(ConcurrentFSStore, "keys", return_value=iter([])):
+            with ZarrIO(self.url, mode="r", preload_metadata=True) as read_io:
+                read_io.open()
+                self.assertIsInstance(read_io.file.store, ConcurrentFSStore)
+                assert_array_equal(read_io.file[:], self.data)
+
+    def test_zarrio_preload_metadata_listing_fails(self):
+        """Test that files are opened without preloading if listing the files is not permitted"""
+        with patch.object(ConcurrentFSStore, "keys", side_effect=PermissionError("Access Denied")):
+            with ZarrIO(self.url, mode="r", preload_metadata=True) as read_io:
+                read_io.open()
+                self.assertIsInstance(read_io.file.store, ConcurrentFSStore)
+                assert_array_equal(read_io.file[:], self.data)
+
+    def test_zarrio_prefetch_consolidated_metadata(self):
+        """Test that chunks are prefetched for files opened with consolidated metadata"""
+        zarr.consolidate_metadata(self.url)
+        prefetched = []
+        read_many = ConcurrentFSStore._read_many
+
+        def record_read_many(store, keys):
+            if threading.current_thread() is not threading.main_thread():
+                prefetched.extend(keys)
+            return read_many(store, keys)
+
+        with patch.object(ConcurrentFSStore, "_read_many", record_read_many):
+            with ZarrIO(self.url, mode="r") as read_io:
+                read_io.open()
+                self.assertIsInstance(read_io.file.store, zarr.storage.ConsolidatedMetadataStore)
+                for i in range(0, 10, 2):
+                    assert_array_equal(read_io.file[i:i + 2], self.data[i:i + 2])
+        self.assertIn("2.0", prefetched)
+
+    def test_zarrio_reuse_remote_store(self):
+        """Test that ZarrIO reuses the store when opening the same remote file again"""
+        zarr.consolidate_metadata(self.url)
+        with ZarrIO(self.url, mode="r") as read_io:
+            read_io.open()
+            store = read_io.file.store.store
+            _, target = read_io.resolve_ref({"source": ".", "path": None})
+            self.assertIs(target.store.store, store)
+
+    def test_preloaded_metadata_store(self):
+        """Test that all metadata are read at once for a file without consolidated metadata"""
+        read_keys = []
+
+        class RecordingStore(ConcurrentFSStore):
+            def getitems(self, keys, **kwargs):
+                read_keys.extend(keys)
+                return super().getitems(keys, **kwargs)
+
+        meta_store = PreloadedMetadataStore(RecordingStore(self.url, mode="r"))
+        self.assertListEqual(read_keys, [".zarray"])
+        self.assertListEqual(list(meta_store), [".zarray"])
+        self.assertNotIn("0.0", meta_store)
+        array = zarr.open_array(store=meta_store, chunk_store=meta_store.store, mode="r")
+        assert_array_equal(array[:], self.data)
+
+    def test_zarrio_preload_metadata(self):
+        """Test that ZarrIO reads the metadata of remote files without consolidated metadata up front"""
+        with ZarrIO(self.url, mode="r", preload_metadata=True) as read_io:
+            read_io.open()
+            self.assertTrue(read_io.preload_metadata)
+            self.assertIsInstance(read_io.file.store, PreloadedMetadataStore)
+            self.assertIsInstance(read_io.file.chunk_store, ConcurrentFSStore)
+            self.assertTrue(read_io.is_remote())
+            assert_array_equal(read_io.file[:], self.data)
+            _, target = read_io.resolve_ref({"source": ".", "path": None})
+            # the preloaded metadata are reused rather than listing the store again
+            self.assertIs(target.store, read_io.file.store)
+        with ZarrIO(self.url, mode="r-") as read_io:
+            read_io.open()
+            self.assertIsInstance(read_io.file.store, ConcurrentFSStore)
+
+
+@unittest.skipIf(not HAVE_FSSPEC, "fsspec not installed")
+class TestConcurrentFSStoreAsync(TestCase):
+    """Test reading chunks from an asynchronous filesystem with latency"""
+
+    def setUp(self):
+        fsspec.register_implementation("latency", LatencyFileSystem, clobber=True)
+        LatencyFileSystem.files = {"root/%d" % i: b"value" for i in range(64)}
+        self.url = "latency://root"
+        self.keys = [str(i) for i in range(64)]
+
+    def tearDown(self):
+        LatencyFileSystem.files = dict()
+
+    def time_getitems(self, store):
+        start = time.perf_counter()
+        values = store.getitems(self.keys, contexts={})
+        elapsed = time.perf_counter() - start
+        self.assertListEqual(sorted(values, key=int), self.keys)
+        return elapsed
+
+    def test_getitems_not_slower_than_fsstore(self):
+        """Test that all chunks are requested at once as by FSStore rather than in smaller batches"""
+        fsstore_elapsed = self.time_getitems(zarr.storage.FSStore(self.url, mode="r"))
+        store = ConcurrentFSStore(self.url, mode="r", cache_size=0, prefetch=False)
+        # FSStore takes about one round trip. Allow for timing noise, but not for another round trip.
+        self.assertLess(self.time_getitems(store), fsstore_elapsed + LatencyFileSystem.latency)
+
+    def test_getitems_max_concurrent_reads(self):
+        """Test that the reads are issued in batches of max_concurrent_reads if given"""
+        store = ConcurrentFSStore(self.url, mode="r", cache_size=0, max_concurrent_reads=16)
+        self.assertGreaterEqual(self.time_getitems(store), 4 * LatencyFileSystem.latency)
+
+
+@unittest.skipIf(not HAVE_PYARROW, "pyarrow not installed")
+class TestArrowFSStore(TestCase):
+    """Test reading Zarr files via a pyarrow filesystem"""
+
+    def setUp(self):
+        self.store_path = os.path.abspath("test_arrow_fsstore.zarr")
+        self.data = np.arange(100).reshape(10, 10)
+        root = zarr.group(store=self.store_path)
+        root.create_group("group").array("data", self.data, chunks=(2, 2))
+        self.store = ArrowFSStore(self.store_path, LocalFileSystem(), max_concurrent_reads=4)
+
+    def tearDown(self):
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+
+    def test_max_concurrent_reads_invalid(self):
+        with self.assertRaisesWith(ValueError, "max_concurrent_reads must be a positive integer"):
+            ArrowFSStore(self.store_path, LocalFileSystem(), max_concurrent_reads=0)
+
+    def test_from_url_invalid(self):
+        with self.assertRaisesWith(ValueError, "ArrowFSStore.from_url only supports s3:// URLs, received file.zarr"):
+            ArrowFSStore.from_url("file.zarr")
+
+    def test_from_url_shared_filesystem(self):
+        store1 = ArrowFSStore.from_url("s3://bucket/file1.zarr", anon=True, region="us-east-1")
+        store2 = ArrowFSStore.from_url("s3://bucket/file2.zarr", anon=True, region="us-east-1")
+        store3 = ArrowFSStore.from_url("s3://bucket/file2.zarr", anon=True, region="us-west-2")
+        self.assertIs(store1.fs, store2.fs)
+        self.assertIsNot(store2.fs, store3.fs)
+        self.assertEqual(store1.path, "bucket/file1.zarr")
+
+    def test_mapping(self):
+        self.assertIn(".zgroup", self.store)
+        self.assertIn("group/data/0.0", self.store)
+        self.assertNotIn("group/data/9.9", self.store)
+        self.assertNotIn("group", self.store)
+        self.assertEqual(self.store["group/data/.zarray"], zarr.DirectoryStore(self.store_path)["group/data/.zarray"])
+        with self.assertRaises(KeyError):
+            self.store["group/data/9.9"]
+        self.assertEqual(len(self.store), 3 + 25)  # .zgroup, group/.zgroup, group/data/.zarray and the chunks
+        self.assertListEqual(self.store.listdir("group"), [".zgroup", "data"])
+        self.assertListEqual(self.store.listdir("missing"), [])
+
+    def test_read_only(self):
+        with self.assertRaises(zarr.errors.ReadOnlyError):
+            self.store["group/data/0.0"] = b""
+        with self.assertRaises(zarr.errors.ReadOnlyError):
+            del self.store["group/data/0.0"]
+
+    def test_getitems(self):
+        values = self.store.getitems(["group/data/0.0", "group/data/9.9"], contexts={})
+        self.assertListEqual(list(values.keys()), ["group/data/0.0"])
+
+    def test_getitems_reuse_executor(self):
+        """Test that the thread pool for concurrent reads is created once per store"""
+        with patch("hdmf_zarr.storage.ThreadPoolExecutor", wraps=ThreadPoolExecutor) as executor_class:
+            self.store.getitems(["group/data/0.0", "group/data/0.1"], contexts={})
+            self.store.getitems(["group/data/1.0", "group/data/1.1"], contexts={})
+        executor_class.assert_called_once_with(max_workers=4)
+
+    def test_pickle(self):
+        self.store.getitems(["group/data/0.0"], contexts={})
+        store = pickle.loads(pickle.dumps(self.store))
+        values = store.getitems(["group/data/0.0", "group/data/9.9"], contexts={})
+        self.assertListEqual(list(values.keys()), ["group/data/0.0"])
+
+    def test_read(self):
+        root = zarr.open_group(store=self.store, mode="r")
+        self.assertListEqual(list(root.group_keys()), ["group"])
+        assert_array_equal(root["group/data"][:], self.data)
+        assert_array_equal(root["group/data"][3:7, 1:5], self.data[3:7, 1:5])
+
+    def test_zarrio_remote_store_invalid(self):
+        with self.assertRaisesWith(ValueError, "remote_store must be one of ('fsspec', 'pyarrow'), received 's3fs'"):
+            ZarrIO(self.store_path, mode="r", remote_store="s3fs")
+
+
+class TestBatchedMetadataStore(TestCase):
+    """Test holding back writes of metadata until they are flushed"""
+
+    def setUp(self):
+        self.inner = zarr.MemoryStore()
+        self.store = BatchedMetadataStore(self.inner)
+
+    def test_hold_back_metadata(self):
+        group = zarr.group(store=self.store)
+        array = group.create_dataset("a/b", data=np.arange(10), chunks=(5,))
+        array.attrs["attr"] = 1
+        # The chunks are written right away, the metadata only once flushed
+        self.assertListEqual(sorted(self.inner), ["a/b/0", "a/b/1"])
+        self.assertListEqual(self.store.listdir(), [".zgroup", "a"])
+        self.assertListEqual(self.store.listdir("a/b"), [".zarray", ".zattrs", "0", "1"])
+        self.assertIn("a/b/.zarray", self.store)
+        self.assertEqual(len(self.store), 6)
+        self.store.flush()
+        self.assertDictEqual(self.store.pending, {})
+        read_array = zarr.open_group(self.inner, mode="r")["a/b"]
+        assert_array_equal(read_array[:], np.arange(10))
+        self.assertEqual(read_array.attrs["attr"], 1)
+
+    def test_flush_setitems(self):
+        self.store["a/.zattrs"] = b"{}"
+        self.store["a/.zattrs"] = b'{"attr": 1}'
+        self.inner.setitems = lambda values: self.inner.update(values)
+        with patch.object(self.inner, "setitems", wraps=self.inner.setitems) as setitems:
+            self.store.flush()
+        setitems.assert_called_once_with({"a/.zattrs": b'{"attr": 1}'})
+
+    def test_close(self):
+        self.store["a/.zattrs"] = b"{}"
+        self.store.close()
+        self.assertEqual(self.inner["a/.zattrs"], b"{}")
+        # Metadata written after closing the store is written through
+        self.store["a/.zattrs"] = b'{"attr": 1}'
+        self.assertDictEqual(self.store.pending, {})
+        self.assertEqual(self.inner["a/.zattrs"], b'{"attr": 1}')
+
+    def test_read_array(self):
+        """Test reading an array back through the store before and after flushing its metadata"""
+        group = zarr.group(store=self.store)
+        array = group.create_dataset("a", data=np.arange(10), chunks=(5,))
+        assert_array_equal(array[:], np.arange(10))
+        assert_array_equal(zarr.open_array(self.store, path="a", mode="r")[2:8], np.arange(2, 8))
+        self.store.flush()
+        assert_array_equal(zarr.open_array(self.store, path="a", mode="r")[:], np.arange(10))
+
+    def test_getitems_kwargs(self):
+        """Test that the keyword arguments of getitems are passed on, e.g., on_error before zarr 2.15"""
+        class GetItemsStore(zarr.MemoryStore):
+            def getitems(self, keys, **kwargs):
+                self.kwargs = kwargs
+                return {key: self[key] for key in keys if key in self}
+
+        inner = GetItemsStore()
+        inner["a/0"] = b"0"
+        store = BatchedMetadataStore(inner)
+        store["a/.zarray"] = b"{}"
+        values = store.getitems(["a/.zarray", "a/0", "a/1"], on_error="omit")
+        self.assertDictEqual(values, {"a/.zarray": b"{}", "a/0": b"0"})
+        self.assertDictEqual(inner.kwargs, {"on_error": "omit"})
+
+    def test_delete(self):
+        self.store["a/.zattrs"] = b"{}"
+        self.inner["b/.zattrs"] = b"{}"
+        del self.store["a/.zattrs"]
+        del self.store["b/.zattrs"]
+        self.assertEqual(len(self.store), 0)
+        with self.assertRaises(KeyError):
+            del self.store["c/.zattrs"]
+
+    def test_rmdir(self):
+        self.store["a/.zgroup"] = b"{}"
+        self.inner["a/b/.zgroup"] = b"{}"
+        self.store["c/.zgroup"] = b"{}"
+        self.store.rmdir("a")
+        self.assertListEqual(list(self.store), ["c/.zgroup"])
+
+
+@unittest.skipIf(not hasattr(os, "O_DIRECT"), "O_DIRECT is not supported on this platform")
+class TestDirectDirectoryStore(TestCase):
+    """Test writing Zarr files with direct I/O"""
+
+    def setUp(self):
+        self.store_path = os.path.abspath("test_direct_directory_store.zarr")
+        self.data = np.arange(10000).reshape(100, 100)
+
+    def tearDown(self):
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+
+    def test_write_array(self):
+        store = DirectDirectoryStore(self.store_path)
+        with patch("os.open", wraps=os.open) as mock_open:
+            zarr.array(self.data, chunks=(30, 100), store=store, compressor=None)
+        # Only the chunks are written with direct I/O, not the metadata
+        direct_writes = [call for call in mock_open.call_args_list if call.args[1] & os.O_DIRECT]
+        self.assertEqual(len(direct_writes), 4)
+        # The files are truncated to the size of the values, e.g., the last chunk is only partially filled
+        self.assertEqual(os.path.getsize(os.path.join(self.store_path, "0.0")), 30 * 100 * self.data.itemsize)
+        assert_array_equal(zarr.open_array(self.store_path, mode="r")[:], self.data)
+
+    def test_small_values(self):
+        store = DirectDirectoryStore(self.store_path)
+        store["key"] = b"value"
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["key"], b"value")
+
+    def test_pickle(self):
+        store = pickle.loads(pickle.dumps(DirectDirectoryStore(self.store_path)))
+        store["key"] = bytes(range(256)) * 20
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["key"], bytes(range(256)) * 20)
+
+    def test_zarrio_direct_io(self):
+        with ZarrIO(self.store_path, mode="w", direct_io=True) as write_io:
+            write_io.open()
+            self.assertIsInstance(write_io.file.store, DirectDirectoryStore)
+            self.assertTrue(write_io.direct_io)
+        with ZarrIO(self.store_path, mode="r") as read_io:
+            read_io.open()
+            self.assertNotIsInstance(read_io.file.store, DirectDirectoryStore)
+
+
+@unittest.skipIf(not HAVE_IO_URING, "liburing is not installed or io_uring is not supported")
+class TestUringDirectoryStore(TestCase):
+    """Test writing Zarr files with batched io_uring submissions"""
+
+    def setUp(self):
+        self.store_path = os.path.abspath("test_uring_directory_store.zarr")
+        self.data = np.arange(10000).reshape(100, 100)
+
+    def tearDown(self):
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+
+    def test_write_array(self):
+        store = UringDirectoryStore(self.store_path, queue_depth=3)
+        with patch.object(UringDirectoryStore, "__setitem__", wraps=store.__setitem__) as mock_setitem, \
+                patch("liburing.io_uring_submit", wraps=liburing.io_uring_submit) as mock_submit:
+            array = zarr.array(self.data, chunks=(30, 30), store=store, compressor=None)
+        # Only the metadata is written item by item, the 16 chunks are submitted in batches of 3
+        self.assertEqual([call.args[0] for call in mock_setitem.call_args_list], [".zarray"])
+        self.assertEqual(mock_submit.call_count, 6)
+        assert_array_equal(zarr.open_array(self.store_path, mode="r")[:], self.data)
+        array[:50] = 0
+        self.assertEqual(np.count_nonzero(zarr.open_array(self.store_path, mode="r")[:50]), 0)
+        store.close()
+        # No temporary files are left behind
+        self.assertFalse([name for name in os.listdir(self.store_path) if name.endswith(".partial")])
+
+    def test_registered_buffers(self):
+        store = UringDirectoryStore(self.store_path, queue_depth=4)
+        with patch("liburing.io_uring_register_buffers", wraps=liburing.io_uring_register_buffers) as mock_register, \
+                patch("liburing.io_uring_prep_write_fixed", wraps=liburing.io_uring_prep_write_fixed) as mock_fixed:
+            array = zarr.array(self.data, chunks=(30, 30), store=store, compressor=None)
+            array[:] = self.data + 1
+        # The chunks of an array without compressor all have the same size such that the buffers are registered once
+        self.assertEqual(mock_register.call_count, 1)
+        self.assertEqual(mock_fixed.call_count, 32)
+        assert_array_equal(zarr.open_array(self.store_path, mode="r")[:], self.data + 1)
+        store.close()
+
+    def test_registered_buffers_limit(self):
+        # Only two of the four values of each batch fit into the registered buffers
+        store = UringDirectoryStore(self.store_path, queue_depth=4, max_registered_size=2 * 30 * 30 * 8)
+        with patch("liburing.io_uring_prep_write_fixed", wraps=liburing.io_uring_prep_write_fixed) as mock_fixed:
+            zarr.array(self.data, chunks=(30, 30), store=store, compressor=None)
+        self.assertEqual(mock_fixed.call_count, 8)
+        assert_array_equal(zarr.open_array(self.store_path, mode="r")[:], self.data)
+        store.close()
+
+    def test_registered_buffers_disabled(self):
+        store = UringDirectoryStore(self.store_path, max_registered_size=0)
+        with patch("liburing.io_uring_register_buffers") as mock_register:
+            zarr.array(self.data, chunks=(30, 30), store=store, compressor=None)
+        mock_register.assert_not_called()
+        assert_array_equal(zarr.open_array(self.store_path, mode="r")[:], self.data)
+        store.close()
+
+    def test_sqpoll(self):
+        store = UringDirectoryStore(self.store_path)
+        with patch("liburing.io_uring_queue_init", wraps=liburing.io_uring_queue_init) as mock_init:
+            store.setitems({"0.0": b"value"})
+        self.assertEqual(mock_init.call_args_list[0].args[2], liburing.IORING_SETUP_SQPOLL)
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["0.0"], b"value")
+        store.close()
+
+    def test_sqpoll_not_supported(self):
+        io_uring_queue_init = liburing.io_uring_queue_init
+
+        def queue_init(entries, ring, flags=0):
+            if flags & liburing.IORING_SETUP_SQPOLL:
+                raise PermissionError(1, "Operation not permitted")
+            return io_uring_queue_init(entries, ring)
+
+        store = UringDirectoryStore(self.store_path)
+        with patch("liburing.io_uring_queue_init", side_effect=queue_init) as mock_init, \
+                patch("liburing.io_uring_submit", wraps=liburing.io_uring_submit) as mock_submit:
+            store.setitems({"0.0": b"value"})
+        # The store falls back to an io_uring instance without polling
+        self.assertEqual(mock_init.call_count, 2)
+        self.assertEqual(mock_submit.call_count, 1)
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["0.0"], b"value")
+        store.close()
+
+    def test_setitems_nested(self):
+        store = UringDirectoryStore(self.store_path)
+        store.setitems({"a/0.0": b"x", "a/b/0.0": np.arange(3, dtype="u1")})
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["a/0.0"], b"x")
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["a/b/0.0"], bytes([0, 1, 2]))
+        store.close()
+
+    def test_setitems_without_io_uring(self):
+        store = UringDirectoryStore(self.store_path)
+        with patch("liburing.io_uring_queue_init", side_effect=OSError):
+            store.setitems({"0.0": b"value"})
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["0.0"], b"value")
+
+    def test_pickle(self):
+        store = pickle.loads(pickle.dumps(UringDirectoryStore(self.store_path, queue_depth=8)))
+        self.assertEqual(store.queue_depth, 8)
+        store.setitems({"0.0": b"value"})
+        self.assertEqual(zarr.DirectoryStore(self.store_path)["0.0"], b"value")
+        store.close()
+
+    def test_zarrio_io_uring(self):
+        with ZarrIO(self.store_path, mode="w", io_uring=True) as write_io:
+            write_io.open()
+            self.assertIsInstance(write_io.file.store, UringDirectoryStore)
+            self.assertTrue(write_io.io_uring)
+        with self.assertRaisesWith(ValueError, "direct_io and io_uring cannot be used together"):
+            ZarrIO(self.store_path, mode="w", direct_io=True, io_uring=True)
@@ -21,9 +21,20 @@ import zarr
 from hdmf_zarr.backend import ZarrIO
 from .utils import BuildDatasetShapeMixin, BarData, BarDataHolder
 from hdmf.spec import DatasetSpec
+import gc
 import os
 import shutil
+import unittest
 import warnings
+from unittest.mock import patch
+
+from hdmf.testing import TestCase
+
+try:
+    import pynwb  # noqa: F401
+    PYNWB_AVAILABLE = True
+except ImportError:
+    PYNWB_AVAILABLE = False
 
 
 CUR_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -188,6 +199,29 @@ class TestConsolidateMetadata(ZarrStoreTestCase):
                 self.fail("ZarrIO.__open_file_consolidated raised an unexpected ValueError: {}".format(e))
 
 
+class TestZarrIOClose(TestCase):
+    """Tests for closing ZarrIO objects."""
+
+    def test_close_uninitialized(self):
+        """Test that close does not fail if the initialization failed before ZarrIO.__init__ was called"""
+        io = ZarrIO.__new__(ZarrIO)
+        io.close()
+        io.close()
+        self.assertIsNone(io.file)
+
+    @unittest.skipIf(not PYNWB_AVAILABLE, "pynwb not installed")
+    def test_close_nwbzarrio_load_namespaces_fails(self):
+        """Test that deleting an NWBZarrIO that failed to load the namespaces does not raise in __del__"""
+        from hdmf_zarr.nwb import NWBZarrIO
+        path = os.path.join(CUR_DIR, 'does_not_exist.zarr')
+        with patch('sys.unraisablehook') as unraisablehook:
+            with self.assertRaises(Exception):
+                NWBZarrIO(path, mode='r')
+            gc.collect()
+        unraisablehook.assert_not_called()
+        self.assertFalse(os.path.exists(path))
+
+
 class TestDimensionLabels(BuildDatasetShapeMixin):
     """
     This is to test setting the dimension_labels as a zarr attribute '_ARRAY_DIMENSIONS'.
@@ -2,6 +2,8 @@ import os
 import tempfile
 from copy import copy, deepcopy
 from abc import ABCMeta, abstractmethod
+from functools import lru_cache
+from importlib.util import find_spec
 
 from hdmf.build import (ObjectMapper, TypeMap, BuildManager)
 from hdmf.container import (Container, Data)
@@ -36,14 +38,14 @@ def get_temp_filepath():
     return temp_file.name
 
 
+@lru_cache(maxsize=None)
 def check_s3fs_ffspec_installed():
-    """Check if s3fs and ffspec are installed required for streaming access from S3"""
-    try:
-        import s3fs    # noqa  F401
-        import fsspec  # noqa  F401
-        return True
-    except ImportError:
-        return False
+    """
+    Check if s3fs and ffspec are installed required for streaming access from S3
+
+    Only looks up the packages without importing them, since importing s3fs (and botocore) is slow.
+    """
+    return find_spec('s3fs') is not None and find_spec('fsspec') is not None
 
 
 ############################################